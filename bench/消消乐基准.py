@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# 基准脚本位于bench/，规则引擎在上一级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from 消消乐引擎 import BoardEngine
+
+# -------------------------- 基准配置 --------------------------
+GRID_SIZES = [8, 16, 32, 64]  # 消除检测与生成耗时测量的网格边长
+MOVE_COUNT = 2000             # 吞吐量测量走的交换数
+LATENCY_REPEATS = 200         # 消除检测每个边长的重复次数
+GENERATE_REPEATS = 20         # 网格生成每个边长的重复次数
+MEMORY_SAMPLES = 1000         # 内存测量时保存的局面副本数
+DEFAULT_THRESHOLD = 0.2       # 比基线差20%以上视为回归
+SEED = 2025
+
+# 指标方向：True表示越大越好（吞吐量），False表示越小越好（耗时、内存）
+HIGHER_IS_BETTER = {
+    "moves_per_second": True,
+    "cascades_per_second": True,
+}
+
+# -------------------------- 测量项 --------------------------
+def bench_throughput(backend):
+    """8x8棋盘上连续执行随机可行交换，返回(每秒交换数, 每秒连锁步数)"""
+    engine = BoardEngine(8, seed=SEED, backend=backend)
+    engine.generate_valid_grid()
+    engine.remaining_steps = MOVE_COUNT + 1  # 没有目标、步数充足，不会提前结束
+    pick = random.Random(SEED)
+    cascades = 0
+    start = time.perf_counter()
+    for _ in range(MOVE_COUNT):
+        moves = engine.list_legal_moves()
+        (r1, c1), (r2, c2) = pick.choice(moves)
+        cascades += len(engine.apply_move(r1, c1, r2, c2).steps)
+    elapsed = time.perf_counter() - start
+    return MOVE_COUNT / elapsed, cascades / elapsed
+
+def bench_find_removable(grid_size, backend):
+    """整盘消除检测的中位耗时（微秒）"""
+    engine = BoardEngine(grid_size, seed=SEED, backend=backend)
+    engine.generate_valid_grid()
+    samples = []
+    for _ in range(LATENCY_REPEATS):
+        engine.board.mark_all_dirty()
+        start = time.perf_counter()
+        engine.find_removable_blocks()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6
+
+def bench_generate(grid_size, backend):
+    """生成有效初始网格的中位耗时（毫秒）"""
+    engine = BoardEngine(grid_size, seed=SEED, backend=backend)
+    samples = []
+    for k in range(GENERATE_REPEATS):
+        start = time.perf_counter()
+        engine.generate_valid_grid(seed=SEED + k)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e3
+
+def bench_memory(backend):
+    """每个8x8局面（引擎副本）占用的字节数"""
+    engine = BoardEngine(8, seed=SEED, backend=backend)
+    engine.generate_valid_grid()
+    engine.init_level_objectives()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = [engine.clone() for _ in range(MEMORY_SAMPLES)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del states
+    return (after - before) / MEMORY_SAMPLES
+
+def run_benchmarks(backend):
+    """运行全部测量项，返回{指标名: 数值}"""
+    results = {}
+    moves_per_second, cascades_per_second = bench_throughput(backend)
+    results["moves_per_second"] = moves_per_second
+    results["cascades_per_second"] = cascades_per_second
+    for n in GRID_SIZES:
+        results[f"find_removable_us_{n}"] = bench_find_removable(n, backend)
+    for n in GRID_SIZES:
+        results[f"generate_ms_{n}"] = bench_generate(n, backend)
+    results["bytes_per_state"] = bench_memory(backend)
+    return results
+
+# -------------------------- 回归比较 --------------------------
+def find_regressions(results, baseline, threshold):
+    """与基线比较，返回[(指标名, 基线值, 本次值, 变差比例)]"""
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if HIGHER_IS_BETTER.get(name, False):
+            worse = (old - value) / old
+        else:
+            worse = (value - old) / old
+        if worse > threshold:
+            regressions.append((name, old, value, worse))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="消消乐规则引擎吞吐量基准（无界面）")
+    parser.add_argument("--backend", default="bytes", choices=["bytes", "bitboard"], help="棋盘后端")
+    parser.add_argument("--output", help="把结果写入JSON文件")
+    parser.add_argument("--baseline", help="与之比较的基线JSON文件")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="允许的最大变差比例（默认0.2即20%%）")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.backend)
+    report = {
+        "meta": {
+            "backend": args.backend,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+    for name, value in results.items():
+        print(f"{name:28s} {value:14.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, old, value, worse in regressions:
+            print(f"回归: {name} {old:.2f} → {value:.2f}（变差{worse:.0%}）")
+        if regressions:
+            return 1
+        print("与基线相比没有超过阈值的回归")
+    return 0
+
+# -------------------------- 程序入口 --------------------------
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,150 @@
 import random
+from collections import deque
 
+#---------- 战斗事件 ----------
+#战斗核心只产生事件，不直接打印；事件记录的是发生当时的名字和数值，之后不会随玩家状态变化
+class BattleEvent:
+    def render(self):
+        """事件在控制台上显示的文字，返回None表示不显示"""
+        return None
+
+class BattleStart(BattleEvent):
+    def render(self):
+        return "=== 战斗开始！ ==="
+
+class TurnStart(BattleEvent):
+    def __init__(self, player):
+        self.player = player
+
+    def render(self):
+        return f"\n--- {self.player}的回合 ---"
+
+class DefenseTick(BattleEvent):
+    def __init__(self, player, remaining):
+        self.player = player
+        self.remaining = remaining  #防御剩余回合数
+
+    def render(self):
+        return f"{self.player}的防御效果还剩{self.remaining}回合！"
+
+class ActionChosen(BattleEvent):
+    ACTION_NAMES = {"1": "攻击", "2": "洞察", "3": "防御"}
+
+    def __init__(self, player, action, is_computer):
+        self.player = player
+        self.action = action
+        self.is_computer = is_computer
+
+    def render(self):
+        #玩家自己输入的选择不用再显示一遍
+        if self.is_computer:
+            return f"{self.player}选择了：{self.ACTION_NAMES[self.action]}"
+        return None
+
+class Attack(BattleEvent):
+    def __init__(self, attacker, target, damage, reduced=0):
+        self.attacker = attacker
+        self.target = target
+        self.damage = damage  #实际造成的伤害
+        self.reduced = reduced  #被防御减免的伤害
+
+    def render(self):
+        text = f"{self.attacker}对{self.target}用出了猛烈一击，造成了{self.damage}点伤害！"
+        if self.reduced:
+            text = f"{self.target}的防御生效，减少了{self.reduced}点伤害！\n" + text
+        return text
+
+class Evade(BattleEvent):
+    def __init__(self, attacker, target):
+        self.attacker = attacker
+        self.target = target
+
+    def render(self):
+        return f"{self.target}成功闪避了{self.attacker}的攻击！"
+
+class Defend(BattleEvent):
+    def __init__(self, player, turns):
+        self.player = player
+        self.turns = turns
+
+    def render(self):
+        return f"{self.player}摆出了防御姿态，准备减少两回合伤害！"
+
+class Inspect(BattleEvent):
+    def __init__(self, player):
+        self.player = player.name
+        self.lvl = player.lvl
+        self.xp = player.xp
+        self.xp_to_level = player.xp_to_level
+        self.health = player.health
+        self.max_health = player.max_health
+        self.attack = player.attack
+        self.evasion = player.evasion
+
+    def render(self):
+        return (f"\n{self.player}的状态：\n"
+                f"等级：{self.lvl} | 经验：{self.xp}/{self.xp_to_level}\n"
+                f"生命值：{self.health}/{self.max_health} | 攻击力：{self.attack}\n"
+                f"闪避率：{self.evasion}%\n")
+
+class GainXp(BattleEvent):
+    def __init__(self, player, amount):
+        self.player = player
+        self.amount = amount
+
+    def render(self):
+        return f"{self.player}获得了{self.amount}点经验！"
+
+class LevelUp(BattleEvent):
+    def __init__(self, player, lvl):
+        self.player = player
+        self.lvl = lvl
+
+    def render(self):
+        return f"恭喜{self.player}升级到{self.lvl}级！属性提升了！"
+
+class Defeat(BattleEvent):
+    def __init__(self, loser, winner):
+        self.loser = loser
+        self.winner = winner
+
+    def render(self):
+        return f"{self.loser}已经被击败！"
+
+class BattleEnd(BattleEvent):
+    def __init__(self, winner):
+        self.winner = winner
+
+    def render(self):
+        return f"\n战斗结束！{self.winner}获得了胜利！"
+
+#---------- 事件接收器 ----------
+class ConsoleSink:
+    """把事件打印到控制台"""
+    def emit(self, event):
+        text = event.render()
+        if text is not None:
+            print(text)
+
+class NullSink:
+    """丢弃所有事件，批量模拟时用"""
+    def emit(self, event):
+        pass
+
+class RingBufferSink:
+    """只保留最近capacity个事件，用于回放或检查自动对战"""
+    def __init__(self, capacity=1000):
+        self.buffer = deque(maxlen=capacity)
+
+    def emit(self, event):
+        self.buffer.append(event)
+
+    def events(self):
+        return list(self.buffer)
+
+console_sink = ConsoleSink()
+
+#---------- 战斗核心 ----------
 class Player:
     base_lvl = 1
     base_xp = 0
@@ -7,7 +152,12 @@ class Player:
     base_attack = 150
     base_evasion = 10   #基础闪避率
     xp_to_level = 100
-    
+    #升级时的属性提升
+    attack_per_level = 30
+    evasion_per_level = 2
+    health_per_level = 100
+    xp_growth = 1.5  #每升一级所需经验的倍数
+
     def __init__(self, name, is_computer=False):
         self.name = name
         self.lvl = self.base_lvl
@@ -18,116 +168,135 @@ class Player:
         self.max_health = self.base_health
         self.defense_turns_remaining = 0  #防御剩余回合数
         self.is_computer = is_computer  #标记是否为电脑控制
-        
-    def 攻击(self, target):
+
+    #以下方法的sink为事件接收器，不传时打印到控制台
+    def 攻击(self, target, sink=None):
+        if sink is None:
+            sink = console_sink
         #检查是否闪避
         if random.randint(1, 100) <= target.evasion:
-            print(f"{target.name}成功闪避了{self.name}的攻击！")
+            sink.emit(Evade(self.name, target.name))
             return
-            
+
         damage = random.randint(int(self.attack * 0.8), int(self.attack * 1.2))
-        
+
         #检查是否防御
+        reduced = 0
         if target.defense_turns_remaining > 0:
             reduced_damage = int(damage * 0.5)  #防御减50%伤
-            print(f"{target.name}的防御生效，减少了{damage - reduced_damage}点伤害！")
+            reduced = damage - reduced_damage
             damage = reduced_damage
-        #伤害结算    
+        #伤害结算
         target.health = max(0, target.health - damage)
-        print(f"{self.name}对{target.name}用出了猛烈一击，造成了{damage}点伤害！")
-        
+        sink.emit(Attack(self.name, target.name, damage, reduced))
+
         if target.health == 0:
-            print(f"{target.name}已经被击败！")
-            self.gain_xp(50 + target.lvl * 10)  #获经验
-            
-    def 洞察(self):
-        print(f"\n{self.name}的状态：")
-        print(f"等级：{self.lvl} | 经验：{self.xp}/{self.xp_to_level}")
-        print(f"生命值：{self.health}/{self.max_health} | 攻击力：{self.attack}")
-        print(f"闪避率：{self.evasion}%\n")
-        
-    def 防御(self):
-        print(f"{self.name}摆出了防御姿态，准备减少两回合伤害！")
+            sink.emit(Defeat(target.name, self.name))
+            self.gain_xp(50 + target.lvl * 10, sink)  #获经验
+
+    def 洞察(self, sink=None):
+        if sink is None:
+            sink = console_sink
+        sink.emit(Inspect(self))
+
+    def 防御(self, sink=None):
+        if sink is None:
+            sink = console_sink
         self.defense_turns_remaining = 2
-        
-    def gain_xp(self, amount):
+        sink.emit(Defend(self.name, self.defense_turns_remaining))
+
+    def gain_xp(self, amount, sink=None):
+        if sink is None:
+            sink = console_sink
         self.xp += amount
-        print(f"{self.name}获得了{amount}点经验！")
-        
+        sink.emit(GainXp(self.name, amount))
+
         #检查是否升级
         while self.xp >= self.xp_to_level:
             self.xp -= self.xp_to_level
             self.lvl += 1
-            self.attack += 30
-            self.evasion += 2  #增加闪避
-            self.max_health += 100
+            self.attack += self.attack_per_level
+            self.evasion += self.evasion_per_level  #增加闪避
+            self.max_health += self.health_per_level
             self.health = self.max_health  #生命回满
-            self.xp_to_level = int(self.xp_to_level * 1.5)  #经验增加
-            print(f"恭喜{self.name}升级到{self.lvl}级！属性提升了！")
+            self.xp_to_level = int(self.xp_to_level * self.xp_growth)  #经验增加
+            sink.emit(LevelUp(self.name, self.lvl))
 
     def computer_choose_action(self):
         if self.health < self.max_health * 0.3:
             #30%生命值以下，有40%概率防御
             if random.random() < 0.4:
                 return "3"
-        
+
         #80%概率攻击，20%概率洞察
         if random.random() < 0.8:
             return "1"
         else:
             return "2"
 
-def 回合制战斗(player, computer):
-    print("=== 战斗开始！ ===")
+#---------- 控制台前端 ----------
+def 控制台选择行动(player):
+    """玩家回合 - 手动选择行动"""
+    print("请选择行动：1.攻击 2.洞察 3.防御")
+    choice = input("输入数字选择：")
+    if choice not in ["1", "2", "3"]:
+        print("无效选择，默认进行攻击！")
+        choice = "1"
+    return choice
+
+def 回合制战斗(player, computer, sink=None, choose_action=None):
+    """进行一场战斗并返回胜者
+
+    sink接收战斗事件，choose_action(玩家)为非电脑一方选择行动；
+    都不传时就是原来的控制台交互模式
+    """
+    if sink is None:
+        sink = console_sink
+    if choose_action is None:
+        choose_action = 控制台选择行动
+    sink.emit(BattleStart())
     current_player = player
     other_player = computer
-    
+
     while True:
         #检查战斗是否结束
         if player.health <= 0:
-            print(f"\n战斗结束！{computer.name}获得了胜利！")
-            break
+            sink.emit(BattleEnd(computer.name))
+            return computer
         if computer.health <= 0:
-            print(f"\n战斗结束！{player.name}获得了胜利！")
-            break
-            
+            sink.emit(BattleEnd(player.name))
+            return player
+
         #当前玩家回合
-        print(f"\n--- {current_player.name}的回合 ---")
-        
+        sink.emit(TurnStart(current_player.name))
+
         #当前玩家回合开始时，处理防御回合减少
         if current_player.defense_turns_remaining > 0:
             current_player.defense_turns_remaining -= 1
-            print(f"{current_player.name}的防御效果还剩{current_player.defense_turns_remaining}回合！")
-        
+            sink.emit(DefenseTick(current_player.name, current_player.defense_turns_remaining))
+
         #根据是否为电脑选择不同的行动方式
         if current_player.is_computer:
             #电脑回合 - 自动选择行动
             choice = current_player.computer_choose_action()
-            #显示电脑的选择
-            action_map = {"1": "攻击", "2": "洞察", "3": "防御"}
-            print(f"{current_player.name}选择了：{action_map[choice]}")
         else:
-            #玩家回合 - 手动选择行动
-            print("请选择行动：1.攻击 2.洞察 3.防御")
-            choice = input("输入数字选择：")
-            if choice not in ["1", "2", "3"]:
-                print("无效选择，默认进行攻击！")
-                choice = "1"
-        
+            choice = choose_action(current_player)
+        sink.emit(ActionChosen(current_player.name, choice, current_player.is_computer))
+
         if choice == "1":
-            current_player.攻击(other_player)
+            current_player.攻击(other_player, sink)
         elif choice == "2":
-            current_player.洞察()
+            current_player.洞察(sink)
         elif choice == "3":
-            current_player.防御()
-            
+            current_player.防御(sink)
+
         #交换回合
         current_player, other_player = other_player, current_player
 
-#创建玩家和电脑
-player = Player('你的精灵')
-computer = Player('野生精灵', is_computer=True)
-
-#开始战斗
-回合制战斗(player, computer)
+if __name__ == "__main__":
+    #创建玩家和电脑
+    player = Player('你的精灵')
+    computer = Player('野生精灵', is_computer=True)
 
+    #开始战斗
+    回合制战斗(player, computer)
@@ -0,0 +1,283 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from 测试 import Player
+
+# -------------------------- 模拟配置 --------------------------
+DEFAULT_BATTLES = 1000000  # 默认模拟的战斗场数
+DEFAULT_BATCH = 1 << 16    # 每批同时推进的战斗数，数组能留在缓存里时最快
+MAX_TURNS = 1000           # 超过此回合数仍未分胜负的战斗记为平局
+COMPACT_RATIO = 0.75       # 进行中的战斗不足这一比例时才压缩数组，避免每回合都整体拷贝
+HISTOGRAM_BINS = 10        # 伤害分布直方图的分段数
+HISTOGRAM_WIDTH = 40       # 直方图最长一栏的字符数
+
+# 以下规则与测试.py中Player.攻击/防御/computer_choose_action一致
+DAMAGE_LOW = 0.8           # 伤害下限为攻击力的0.8倍
+DAMAGE_HIGH = 1.2          # 伤害上限为攻击力的1.2倍
+DEFENSE_SHIFT = 1          # 防御减50%伤：int(伤害 × 0.5)即伤害右移一位
+DEFENSE_TURNS = 2          # 防御持续回合数
+KILL_XP_BASE = 50          # 击败奖励经验 = 50 + 对手等级 × 10
+KILL_XP_PER_LVL = 10
+AI_LOW_HEALTH = 0.3        # 电脑生命值低于30%时考虑防御
+AI_DEFEND_CHANCE = 0.4     # 低血量时防御的概率
+AI_ATTACK_CHANCE = 0.8     # 否则攻击的概率（其余为洞察）
+
+UNIFORM_BITS = 16         # 每个随机数取16位，与连续均匀分布的概率偏差不超过1/65536
+UNIFORM_RANGE = 1 << UNIFORM_BITS
+AI_DEFEND_CUT = round(AI_DEFEND_CHANCE * UNIFORM_RANGE)
+AI_ATTACK_CUT = round(AI_ATTACK_CHANCE * UNIFORM_RANGE)
+
+# 玩家一方的行动策略：attack为每回合都攻击，ai为与电脑相同的策略
+PLAYER_POLICIES = ["attack", "ai"]
+
+# -------------------------- 批量状态 --------------------------
+class SideArrays:
+    """一批战斗中某一方的全部状态，每个属性是长度为战斗数的数组
+
+    所有属性存放在同一个二维数组里，属性名只是各行的视图，压缩时一次拷贝即可
+    """
+    STATS = ("lvl", "xp", "xp_to_level", "health", "max_health", "attack", "evasion", "defense")
+    DERIVED = ("damage_low", "damage_span", "evade_cut", "low_health")
+
+    def __init__(self, n, stats):
+        self.data = np.empty((len(self.STATS) + len(self.DERIVED), n), dtype=np.int32)
+        for row, name in enumerate(self.STATS):
+            self.data[row] = stats[name]
+        self._bind()
+        self.update_derived(slice(None))
+
+    def _bind(self):
+        for row, name in enumerate(self.STATS + self.DERIVED):
+            setattr(self, name, self.data[row])
+
+    def update_derived(self, idx):
+        """属性变化后重新计算每回合要用的派生量，免得每回合重复换算"""
+        # 伤害范围：randint(int(攻击×0.8), int(攻击×1.2))
+        attack = self.attack[idx]
+        low = (attack * DAMAGE_LOW).astype(np.int32)
+        self.damage_low[idx] = low
+        span = (attack * DAMAGE_HIGH).astype(np.int32) - low + 1
+        if span.max() >= 1 << (31 - UNIFORM_BITS):
+            raise ValueError("攻击力过大，伤害换算会溢出")
+        self.damage_span[idx] = span
+        # randint(1, 100) <= 闪避率 ⇔ 16位随机数 < ceil(闪避率 × 65536 / 100)
+        self.evade_cut[idx] = (self.evasion[idx] * UNIFORM_RANGE + 99) // 100
+        # 整数生命值 < 最大生命值 × 0.3 ⇔ 生命值 < 向上取整后的阈值
+        self.low_health[idx] = np.ceil(self.max_health[idx] * AI_LOW_HEALTH)
+
+    def compress(self, keep):
+        """只保留keep为真的战斗"""
+        self.data = self.data[:, keep]
+        self._bind()
+
+def player_stats(**overrides):
+    """按Player的类属性给出初始状态，可用关键字参数覆盖（调平衡时用）"""
+    stats = {
+        "lvl": Player.base_lvl,
+        "xp": Player.base_xp,
+        "xp_to_level": Player.xp_to_level,
+        "health": Player.base_health,
+        "max_health": Player.base_health,
+        "attack": Player.base_attack,
+        "evasion": Player.base_evasion,
+        "defense": 0,
+    }
+    for name, value in overrides.items():
+        if name not in stats:
+            raise ValueError(f"未知属性：{name}")
+        stats[name] = value
+    if "health" in overrides and "max_health" not in overrides:
+        stats["max_health"] = stats["health"]
+    return stats
+
+# -------------------------- 规则 --------------------------
+def choose_actions(policy, side, r_defend, r_attack):
+    """按两个16位随机数选择行动，返回(攻击掩码, 防御掩码)，其余战斗本回合为洞察（不影响战局）"""
+    if policy == "attack":
+        return np.ones(side.health.size, dtype=bool), np.zeros(side.health.size, dtype=bool)
+    defend = (side.health < side.low_health) & (r_defend < AI_DEFEND_CUT)
+    attack = ~defend & (r_attack < AI_ATTACK_CUT)
+    return attack, defend
+
+def gain_xp(side, idx, amount):
+    """idx处的战斗获得经验并按Player.gain_xp的规则连续升级，返回升过级的战斗掩码"""
+    side.xp[idx] += amount
+    leveled = np.zeros(idx.size, dtype=bool)
+    pending = np.flatnonzero(side.xp[idx] >= side.xp_to_level[idx])
+    while pending.size:
+        leveled[pending] = True
+        up = idx[pending]
+        side.xp[up] -= side.xp_to_level[up]
+        side.lvl[up] += 1
+        side.attack[up] += Player.attack_per_level
+        side.evasion[up] += Player.evasion_per_level
+        side.max_health[up] += Player.health_per_level
+        side.health[up] = side.max_health[up]
+        side.xp_to_level[up] = (side.xp_to_level[up] * Player.xp_growth).astype(np.int32)
+        side.update_derived(up)
+        pending = pending[side.xp[up] >= side.xp_to_level[up]]
+    return leveled
+
+def simulate_batch(n, rng, player_policy="attack", player=None, computer=None):
+    """同时推进n场独立战斗，玩家一方先手，返回本批的统计结果"""
+    sides = [SideArrays(n, player or player_stats()), SideArrays(n, computer or player_stats())]
+    policies = [player_policy, "ai"]
+    ids = np.arange(n)                       # 数组中每个位置对应的战斗在本批中的编号
+    live = np.ones(n, dtype=bool)            # 该位置的战斗是否仍在进行
+    remaining = n
+    winner = np.zeros(n, dtype=np.int8)      # 1为玩家胜，-1为电脑胜，0为平局
+    turns = np.full(n, MAX_TURNS, dtype=np.int32)
+    damage_counts = np.zeros(0, dtype=np.int64)
+    attacks = evaded = guarded = leveled = 0
+
+    # 所有战斗都从玩家开始轮流行动，同一回合的行动方一致，不必逐场区分
+    for turn in range(1, MAX_TURNS + 1):
+        if remaining == 0:
+            break
+        side = (turn - 1) % 2
+        me, foe = sides[side], sides[1 - side]
+
+        # 回合开始时防御剩余回合数减一
+        me.defense -= me.defense > 0
+
+        # 把64位原始随机数切成4行16位随机数供本回合使用，比逐个生成浮点数快得多
+        bits = rng.bit_generator.random_raw(ids.size).view(np.uint16).reshape(4, ids.size)
+        attack, defend = choose_actions(policies[side], me, bits[0], bits[1])
+        attack &= live
+        me.defense[defend] = DEFENSE_TURNS
+
+        miss = attack & (bits[2] < foe.evade_cut)
+        hit = attack & ~miss
+        damage = me.damage_low + ((bits[3] * me.damage_span) >> UNIFORM_BITS)
+        guard = hit & (foe.defense > 0)
+        np.right_shift(damage, guard.view(np.int8) * DEFENSE_SHIFT, out=damage)
+        damage *= hit
+        foe.health -= damage
+        np.maximum(foe.health, 0, out=foe.health)
+
+        attacks += int(np.count_nonzero(attack))
+        evaded += int(np.count_nonzero(miss))
+        guarded += int(np.count_nonzero(guard))
+        counts = np.bincount(damage)
+        counts[0] -= damage.size - int(np.count_nonzero(hit))  # 没命中的位置伤害记为0，不计入分布
+        if counts.size > damage_counts.size:
+            counts[:damage_counts.size] += damage_counts
+            damage_counts = counts
+        else:
+            damage_counts[:counts.size] += counts
+
+        kill = hit & (foe.health == 0)
+        if not kill.any():
+            continue
+        dead = np.flatnonzero(kill)
+        leveled += int(np.count_nonzero(gain_xp(me, dead, KILL_XP_BASE + foe.lvl[dead] * KILL_XP_PER_LVL)))
+        finished = ids[dead]
+        winner[finished] = 1 if side == 0 else -1
+        turns[finished] = turn
+        live[dead] = False
+        remaining -= dead.size
+        if remaining <= live.size * COMPACT_RATIO:
+            ids = ids[live]
+            me.compress(live)
+            foe.compress(live)
+            live = np.ones(remaining, dtype=bool)
+
+    return {
+        "winner": winner,
+        "turns": turns,
+        "damage_counts": damage_counts,
+        "attacks": attacks,
+        "evaded": evaded,
+        "guarded": guarded,
+        "leveled": leveled,
+    }
+
+def simulate(count, seed=None, batch=DEFAULT_BATCH, player_policy="attack", player=None, computer=None):
+    """分批模拟count场战斗，返回汇总后的统计结果"""
+    if count <= 0 or batch <= 0:
+        raise ValueError("战斗场数和每批战斗数都必须是正整数")
+    rng = np.random.default_rng(seed)
+    parts = []
+    done = 0
+    while done < count:
+        n = min(batch, count - done)
+        parts.append(simulate_batch(n, rng, player_policy, player, computer))
+        done += n
+
+    size = max(part["damage_counts"].size for part in parts)
+    damage_counts = np.zeros(size, dtype=np.int64)
+    for part in parts:
+        damage_counts[:part["damage_counts"].size] += part["damage_counts"]
+    return {
+        "winner": np.concatenate([part["winner"] for part in parts]),
+        "turns": np.concatenate([part["turns"] for part in parts]),
+        "damage_counts": damage_counts,
+        "attacks": sum(part["attacks"] for part in parts),
+        "evaded": sum(part["evaded"] for part in parts),
+        "guarded": sum(part["guarded"] for part in parts),
+        "leveled": sum(part["leveled"] for part in parts),
+    }
+
+# -------------------------- 报告 --------------------------
+def damage_percentile(damage_counts, q):
+    """按伤害计数求分位数"""
+    cumulative = np.cumsum(damage_counts)
+    return int(np.searchsorted(cumulative, cumulative[-1] * q / 100))
+
+def report(result, elapsed):
+    winner = result["winner"]
+    turns = result["turns"]
+    count = winner.size
+    decided = winner != 0
+    print(f"模拟 {count} 场战斗，用时 {elapsed:.2f} 秒（{count / elapsed:,.0f} 场/秒）")
+    print(f"玩家胜率 {np.mean(winner == 1):.2%} | 电脑胜率 {np.mean(winner == -1):.2%} | "
+          f"平局 {np.mean(~decided):.2%}")
+    if decided.any():
+        decided_turns = turns[decided]
+        print(f"平均回合数 {decided_turns.mean():.2f} | 中位数 {np.median(decided_turns):.0f} | "
+              f"p99 {np.percentile(decided_turns, 99):.0f}")
+    print(f"胜者击败对手后升级的比例 {result['leveled'] / max(np.count_nonzero(decided), 1):.2%}")
+
+    attacks = result["attacks"]
+    damage_counts = result["damage_counts"]
+    hits = int(damage_counts.sum())
+    if not attacks or not hits:
+        return
+    print(f"攻击 {attacks} 次：闪避 {result['evaded'] / attacks:.2%} | "
+          f"命中时被防御 {result['guarded'] / hits:.2%}")
+    values = np.arange(damage_counts.size)
+    print(f"单次伤害：平均 {(values * damage_counts).sum() / hits:.1f} | "
+          f"p5 {damage_percentile(damage_counts, 5)} | p50 {damage_percentile(damage_counts, 50)} | "
+          f"p95 {damage_percentile(damage_counts, 95)}")
+
+    # 伤害分布直方图
+    nonzero = np.flatnonzero(damage_counts)
+    low, high = int(nonzero[0]), int(nonzero[-1]) + 1
+    edges = np.linspace(low, high, HISTOGRAM_BINS + 1).astype(np.int64)
+    bins = [int(damage_counts[a:b].sum()) for a, b in zip(edges[:-1], edges[1:])]
+    peak = max(bins)
+    for a, b, c in zip(edges[:-1], edges[1:], bins):
+        if b > a:
+            print(f"{a:5d}-{b - 1:<5d} {'█' * round(c / peak * HISTOGRAM_WIDTH):{HISTOGRAM_WIDTH}s} {c / hits:.2%}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量模拟测试.py中的回合制战斗（无交互）")
+    parser.add_argument("--count", type=int, default=DEFAULT_BATTLES, help="模拟的战斗场数")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH, help="每批同时推进的战斗数")
+    parser.add_argument("--player-policy", default="attack", choices=PLAYER_POLICIES, help="玩家一方的行动策略")
+    args = parser.parse_args(argv)
+    if args.count <= 0 or args.batch <= 0:
+        parser.error("--count和--batch必须是正整数")
+
+    start = time.perf_counter()
+    result = simulate(args.count, args.seed, args.batch, args.player_policy)
+    report(result, time.perf_counter() - start)
+    return 0
+
+# -------------------------- 程序入口 --------------------------
+if __name__ == "__main__":
+    sys.exit(main())
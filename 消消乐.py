@@ -1,32 +1,50 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
-import random
+import os
 import sys
 import ctypes
-from enum import Enum
-
-# -------------------------- 游戏常量定义 --------------------------
-class ElementType(Enum):
-    """元素类型枚举（使用红橙黄绿蓝紫六种易于区分的颜色）"""
-    红色 = "#FF4444"    # 鲜明的红色
-    橙色 = "#FF7700"    # 调整后的橙色，提高区分度
-    黄色 = "#FFDD44"    # 柔和的黄色
-    绿色 = "#00CC66"    # 清新的绿色
-    蓝色 = "#3366FF"    # 鲜明的蓝色
-    紫色 = "#AA33BB"    # 明显的紫色
-    横向特效 = "#FF9800"
-    纵向特效 = "#F44336"
-    爆炸特效 = "#9C27B0"
-    魔力鸟 = "#FFEB3B"
-
-# 游戏配置
-BASE_GRID_SIZE = 8
+import json
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from 消消乐引擎 import (ElementType, BoardEngine, BASE_GRID_SIZE, LevelPack, save_session,
+                      submit_difficulty, collect_difficulty, EMPTY, ELEMENT_TO_CODE, CODE_TO_COLOR)
+
+# 游戏配置（规则相关常量见消消乐引擎）
 BASE_BLOCK_SIZE = 50
 BASE_PADDING = 2
-MAX_CHAIN_DEPTH = 20
-MIN_TARGET_COUNT = 10     # 目标最小数量
-MAX_TARGET_COUNT = 25     # 目标最大数量
-STEP_CALCULATION_FACTOR = 0.7  # 步数计算因子，控制难度
+
+# 动画时长（毫秒），由帧调度器按FRAME_MS推进
+FRAME_MS = 16  # 约60帧每秒
+SWAP_MS = 120
+CLEAR_MS = 150
+DROP_MS = 180
+REFILL_MS = 180
+
+# 棋盘大小：超过视口边长时只为视口内的格子创建画布元素，其余部分虚拟滚动
+GRID_SIZE_CHOICES = [8, 12, 16, 32, 50, 100]
+VIEWPORT_CELLS = 12       # 视口最多显示的格子边长
+MAX_SIMULATED_GRID = 16   # 超过该边长的棋盘用经验公式计算步数（模拟试玩太慢）
+
+# 步数模拟在常驻进程池中进行，界面线程只定时查看结果
+STEP_ESTIMATE_WORKERS = os.cpu_count() or 1
+STEP_ESTIMATE_POLL_MS = 50
+
+# 录像保存目录（可用 python 消消乐引擎.py 录像文件 回放）
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "消消乐录像")
+
+# 性能剖析（F3开关叠加层，F4导出Chrome trace，可在chrome://tracing或Perfetto中打开）
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "消消乐性能")
+PROFILE_WINDOW = 500        # 每个阶段用于计算分位数的最近样本数
+PROFILE_TRACE_LIMIT = 100000  # 最多保留的trace事件数
+PROFILE_REFRESH_MS = 500    # 叠加层刷新间隔
+# 界面阶段只是把结算结果同步到显示网格和画布；规则计算在引擎阶段里，apply_move是一次交换的总耗时
+PROFILE_GAME_STAGES = ["_process_elimination", "_drop_blocks", "_fill_new_blocks", "_draw_blocks"]
+PROFILE_ENGINE_STAGES = ["apply_move", "find_removable_blocks", "detect_elimination_patterns",
+                         "resolve_blasts", "eliminate", "collapse_and_refill"]
+PROFILE_ANIMATOR_STAGES = ["_tick"]  # 每帧动画的耗时（帧与帧之间的空白即定时器等待）
 
 # 界面颜色
 BACKGROUND_COLOR = "#F8F9FA"
@@ -35,18 +53,9 @@ TEXT_COLOR = "#2D3436"
 BUTTON_COLOR = "#FFFFFF"  # 白底
 BUTTON_TEXT_COLOR = "#000000"  # 黑字
 SELECTED_BORDER = "#3498DB"
+HINT_BORDER = "#2ECC71"
 NORMAL_BORDER = "#FFFFFF"
 
-# 普通元素列表（红橙黄绿蓝紫）
-REGULAR_ELEMENTS = [
-    ElementType.红色,
-    ElementType.橙色,
-    ElementType.黄色,
-    ElementType.绿色,
-    ElementType.蓝色,
-    ElementType.紫色
-]
-
 # -------------------------- 高DPI适配 --------------------------
 class DPIHandler:
     """处理不同屏幕的DPI适配"""
@@ -67,29 +76,232 @@ class DPIHandler:
         """按系统缩放因子缩放值"""
         return int(value * self.scale_factor)
 
-# -------------------------- 关卡目标类 --------------------------
-class LevelObjective:
-    """关卡目标类"""
-    def __init__(self, target_type, required_count):
-        self.target_type = target_type  # 目标元素类型
-        self.required_count = required_count  # 需要收集的数量
-        self.current_count = 0  # 当前收集数量
-    
-    def is_completed(self):
-        """检查目标是否完成"""
-        return self.current_count >= self.required_count
+# -------------------------- 帧调度动画 --------------------------
+class AnimationScheduler:
+    """帧调度动画：动画阶段排成时间线，由单个after定时器按固定帧间隔推进
+
+    每个阶段为(时长, 开始回调, 逐帧回调, 结束回调)，逐帧回调收到0~1的进度。
+    一帧内剩余的时间会直接用于下一阶段，加速模式下所有阶段时长视为0，一帧内播完。
+    """
+    def __init__(self, root, frame_ms=FRAME_MS):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.turbo = False
+        self.phases = deque()
+        self.current = None  # 正在播放的阶段
+        self.elapsed = 0.0  # 当前阶段已播放的毫秒数
+        self.timer = None
+        self.ticking = False  # 正在推进（回调中追加阶段时不重入）
+        self.last_time = 0.0
+
+    def add(self, duration, on_start=None, on_frame=None, on_end=None):
+        """追加一个动画阶段，空闲时立即开始推进"""
+        self.phases.append((duration, on_start, on_frame, on_end))
+        if self.timer is None and not self.ticking:
+            self.last_time = time.perf_counter()
+            self._tick()
+
+    def cancel(self):
+        """丢弃所有未播放的阶段"""
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+            self.timer = None
+        self.phases.clear()
+        self.current = None
+
+    def _tick(self):
+        """推进一帧"""
+        self.timer = None
+        self.ticking = True
+        try:
+            self._advance()
+        finally:
+            self.ticking = False
+
+    def _advance(self):
+        """用上一帧以来经过的时间推进时间线"""
+        now = time.perf_counter()
+        budget = (now - self.last_time) * 1000
+        self.last_time = now
+        while self.current is not None or self.phases:
+            if self.current is None:
+                self.current = self.phases.popleft()
+                self.elapsed = 0.0
+                on_start = self.current[1]
+                if on_start:
+                    on_start()  # 回调中可能调用cancel
+                continue
+            duration, _, on_frame, on_end = self.current
+            if self.turbo:
+                duration = 0
+            remaining = duration - self.elapsed
+            if budget < remaining:
+                # 本帧时间不够播完当前阶段
+                self.elapsed += budget
+                if on_frame:
+                    on_frame(self.elapsed / duration)
+                self.timer = self.root.after(self.frame_ms, self._tick)
+                return
+            budget -= max(remaining, 0)
+            self.current = None
+            if on_frame:
+                on_frame(1.0)
+            if on_end:
+                on_end()
+
+def ease(t):
+    """缓入缓出插值"""
+    return t * t * (3 - 2 * t)
+
+# -------------------------- 贴图集 --------------------------
+class SpriteAtlas:
+    """方块贴图集：每种(元素, 边框颜色)一张预渲染的PhotoImage
     
-    def add_progress(self, count=1):
-        """增加进度"""
-        self.current_count = min(self.current_count + count, self.required_count)
+    PhotoImage对象创建后固定不变，方块尺寸变化时原地重绘，
+    引用它的画布元素无需逐个修改。每种贴图在每个方块尺寸下只绘制一次。
+    """
+    def __init__(self):
+        self.block_size = 0
+        self.images = {}  # (元素, 边框颜色) -> PhotoImage
+
+    def get(self, element, border=NORMAL_BORDER):
+        """取贴图（首次使用时创建）"""
+        key = (element, border)
+        image = self.images.get(key)
+        if image is None:
+            image = tk.PhotoImage(width=self.block_size, height=self.block_size)
+            self._render(image, key)
+            self.images[key] = image
+        return image
+
+    def resize(self, block_size):
+        """按新的方块尺寸重绘所有已创建的贴图"""
+        if block_size == self.block_size:
+            return
+        self.block_size = block_size
+        for key, image in self.images.items():
+            image.config(width=block_size, height=block_size)
+            self._render(image, key)
+
+    def _render(self, image, key):
+        """按当前方块尺寸绘制像素数据并写入贴图（贴图本身即缓存，不另存旧尺寸的像素）"""
+        image.put(self._make_pixels(*key), to=(0, 0))
+
+    def _make_pixels(self, element, border):
+        """逐行绘制方块：底色、边框和特殊元素标记"""
+        size = self.block_size
+        # 底色取自引擎的编码→颜色表，空格（None）用背景色
+        fill = CODE_TO_COLOR[ELEMENT_TO_CODE.get(element, EMPTY)] or BACKGROUND_COLOR
+        edge = 2 if border == NORMAL_BORDER else 3
+        half = size // 2
+        ring = (size - 20) / 2  # 爆炸特效圆环半径
+        rows = []
+        for y in range(size):
+            if y < edge or y >= size - edge:
+                row = [border] * size
+            else:
+                row = [border] * edge + [fill] * (size - 2 * edge) + [border] * edge
+                if element == ElementType.横向特效 and abs(y - half) <= 1:
+                    row[5:size - 5] = ["#FFFFFF"] * (size - 10)
+                elif element == ElementType.纵向特效 and 5 <= y < size - 5:
+                    row[half - 1:half + 2] = ["#FFFFFF"] * 3
+                elif element == ElementType.爆炸特效:
+                    for x in range(edge, size - edge):
+                        if abs(((x - half) ** 2 + (y - half) ** 2) ** 0.5 - ring) <= 1.5:
+                            row[x] = "#FFFFFF"
+                elif element == ElementType.魔力鸟:
+                    reach = size // 5 - abs(y - half)
+                    if reach >= 0:
+                        row[half - reach:half + reach + 1] = ["#000000"] * (2 * reach + 1)
+            rows.append("{" + " ".join(row) + "}")
+        return " ".join(rows)
+
+# -------------------------- 性能剖析 --------------------------
+class Profiler:
+    """可选的热点计时：开启时用计时包装替换实例上的方法，关闭时删除包装，关闭状态零开销
     
-    def get_progress_text(self):
-        """获取进度文本（使用中文颜色名称）"""
-        return f"{self.target_type.name}: {self.current_count}/{self.required_count}"
+    每个阶段记录调用次数和最近PROFILE_WINDOW次耗时（纳秒），并保留trace事件供导出。
+    """
+    def __init__(self):
+        self.enabled = False
+        self.installed = []  # 已包装的(对象, 方法名)
+        self.samples = {}  # 阶段 → 最近耗时deque
+        self.counts = {}  # 阶段 → 调用次数
+        self.events = deque(maxlen=PROFILE_TRACE_LIMIT)  # (阶段, 开始ns, 耗时ns)
+
+    def install(self, obj, names):
+        """给对象上的一组方法装上计时包装（已开启时才生效）"""
+        if not self.enabled:
+            return
+        for name in names:
+            if name not in vars(obj):
+                setattr(obj, name, self._timed(name, getattr(obj, name)))
+                self.installed.append((obj, name))
+
+    def release(self, obj):
+        """移除某个对象上的包装（例如换局时丢弃旧引擎）"""
+        for name in [name for owner, name in self.installed if owner is obj]:
+            if name in vars(obj):
+                delattr(obj, name)
+        self.installed = [(owner, name) for owner, name in self.installed if owner is not obj]
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        """关闭剖析并移除所有包装（已收集的数据保留，可继续导出）"""
+        for obj, name in self.installed:
+            if name in vars(obj):
+                delattr(obj, name)
+        self.installed = []
+        self.enabled = False
+
+    def _timed(self, stage, func):
+        """计时包装：perf_counter_ns计时，记入样本、计数和trace"""
+        samples = self.samples.setdefault(stage, deque(maxlen=PROFILE_WINDOW))
+        self.counts.setdefault(stage, 0)
+        counts = self.counts
+        events = self.events
+        clock = time.perf_counter_ns
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                samples.append(elapsed)
+                counts[stage] += 1
+                events.append((stage, start, elapsed))
+        return wrapper
+
+    def summary(self):
+        """每个阶段的(阶段, 调用次数, p50微秒, p99微秒)"""
+        rows = []
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            p50 = ordered[len(ordered) // 2] / 1000
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] / 1000
+            rows.append((stage, self.counts[stage], p50, p99))
+        return rows
+
+    def export_chrome_trace(self, path):
+        """按Chrome trace-event格式（完整事件"X"，微秒）写出JSON"""
+        pid = os.getpid()
+        trace = {
+            "traceEvents": [
+                {"name": stage, "ph": "X", "ts": start / 1000, "dur": elapsed / 1000, "pid": pid, "tid": 1}
+                for stage, start, elapsed in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
 
 # -------------------------- 游戏核心类 --------------------------
 class MatchThreeGame:
-    def __init__(self, root):
+    def __init__(self, root, level_pack=None):
         # DPI适配
         self.dpi = DPIHandler()
         
@@ -103,22 +315,41 @@ class MatchThreeGame:
         # 窗口居中
         self._center_window()
         
+        # 关卡包（None表示每局现场随机生成）
+        self.level_pack = level_pack
+        self.level_index = 0  # 关卡包中当前关卡的序号
+        
         # 游戏基础参数
         self.grid_size = BASE_GRID_SIZE
         self.block_size = self.dpi.scale(BASE_BLOCK_SIZE)
         self.padding = self.dpi.scale(BASE_PADDING)
+        self.pitch = self.block_size + self.padding  # 相邻格子的间距（缓存的布局）
+        self.atlas = SpriteAtlas()  # 方块贴图
+        self.atlas.resize(self.block_size)
         self.window_scale = 1.0
         
         # 游戏状态
-        self.grid = []  # 游戏网格
-        self.block_ids = []  # 画布元素ID
+        self.engine = None  # 规则引擎（权威棋盘状态）
+        self.grid = []  # 显示网格（播放动画用）
+        self.view_size = min(self.grid_size, VIEWPORT_CELLS)  # 视口边长（格）
+        self.view_row = 0  # 视口左上角对应的棋盘行
+        self.view_col = 0  # 视口左上角对应的棋盘列
+        self.block_ids = []  # 视口内每格一个图片元素的ID
+        self.drawn_grid = []  # 影子网格：上次绘制到视口各格的(元素, 边框颜色)
         self.selected_pos = (-1, -1)  # 选中位置
+        self.hint_cells = []  # 当前提示的两个方块
         self.score = 0
         self.remaining_steps = 0  # 剩余步数，动态计算
         self.max_steps = 0  # 最大步数
         self.is_processing = False  # 防止并行操作
+        self.step_pool = None  # 步数模拟用的进程池（首次需要时创建，关闭窗口时释放）
+        self.step_estimate = None  # 进行中的步数模拟 (引擎, futures)
+        self.step_estimate_timer = None
+        self.animator = AnimationScheduler(self.root)  # 动画时间线
+        self.profiler = Profiler()  # 热点计时（F3开关）
+        self.profile_timer = None  # 叠加层刷新定时器
+        self.item_offsets = {}  # 动画中画布元素相对原位的偏移
         self.game_running = False
-        self.chain_depth = 0  # 连锁深度
         self.combo_count = 0  # 连击计数
         
         # 关卡目标
@@ -133,6 +364,11 @@ class MatchThreeGame:
         self.resize_timer = None
         self.root.bind("<Configure>", self._on_resize)
         
+        # 性能剖析：F3开关叠加层，F4导出trace
+        self.root.bind("<F3>", lambda e: self.toggle_profiler())
+        self.root.bind("<F4>", lambda e: self.export_profile())
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        
         # 显示开始界面
         self.show_start_screen()
 
@@ -209,8 +445,8 @@ class MatchThreeGame:
         rules = ["•本游戏由MrZ开发，游玩愉快",
             "• 交换相邻方块，3个及以上同色相连即可消除",
             "• 四连消除生成直线特效，五连生成魔力鸟",
-            "• T/L形五连生成爆炸特效，特殊元素组合有惊喜",
-            "• 根据方块分布智能计算步数，完成目标即可胜利"
+            "• T/L/十字形消除生成爆炸特效，特殊元素组合有惊喜",
+            "• 根据模拟试玩智能计算步数，完成目标即可胜利"
         ]
         rule_frame = tk.Frame(center_frame, bg=BACKGROUND_COLOR)
         rule_frame.pack(pady=10)
@@ -223,6 +459,23 @@ class MatchThreeGame:
                 bg=BACKGROUND_COLOR
             ).pack(pady=5, anchor=tk.W)
         
+        # 棋盘大小
+        size_frame = tk.Frame(center_frame, bg=BACKGROUND_COLOR)
+        size_frame.pack(pady=(20, 0))
+        tk.Label(
+            size_frame,
+            text="棋盘大小:",
+            font=("微软雅黑", 12),
+            fg=TEXT_COLOR,
+            bg=BACKGROUND_COLOR
+        ).pack(side=tk.LEFT, padx=5)
+        self.grid_size_var = tk.StringVar(value=str(BASE_GRID_SIZE))
+        tk.OptionMenu(
+            size_frame,
+            self.grid_size_var,
+            *[str(size) for size in GRID_SIZE_CHOICES]
+        ).pack(side=tk.LEFT, padx=5)
+        
         # 按钮
         btn_frame = tk.Frame(center_frame, bg=BACKGROUND_COLOR)
         btn_frame.pack(pady=30)
@@ -301,6 +554,23 @@ class MatchThreeGame:
             width=10
         ).pack(side=tk.RIGHT, padx=10)
         
+        self._create_styled_button(
+            right_frame,
+            text="提示",
+            command=self.hint,
+            font_size=12,
+            width=6
+        ).pack(side=tk.RIGHT, padx=10)
+        
+        self.turbo_button = self._create_styled_button(
+            right_frame,
+            text="加速: 关",
+            command=self.toggle_turbo,
+            font_size=12,
+            width=8
+        )
+        self.turbo_button.pack(side=tk.RIGHT, padx=10)
+        
         # 中间区域：游戏区和目标区
         middle_frame = tk.Frame(self.game_frame, bg=BACKGROUND_COLOR)
         middle_frame.pack(fill=tk.BOTH, expand=True)
@@ -314,9 +584,30 @@ class MatchThreeGame:
             bg=BACKGROUND_COLOR,
             highlightthickness=0
         )
-        self.game_canvas.pack(padx=10, pady=10)
+        self.game_canvas.grid(row=0, column=0, padx=10, pady=10)
         self.game_canvas.bind("<Button-1>", self._on_block_click)
         
+        # 大棋盘的滚动条（棋盘比视口大时才显示）
+        self.y_scrollbar = tk.Scrollbar(
+            canvas_container,
+            orient=tk.VERTICAL,
+            command=lambda *args: self._on_scrollbar("y", *args)
+        )
+        self.x_scrollbar = tk.Scrollbar(
+            canvas_container,
+            orient=tk.HORIZONTAL,
+            command=lambda *args: self._on_scrollbar("x", *args)
+        )
+        # 滚轮滚动视口（Windows/macOS为<MouseWheel>，X11为<Button-4>/<Button-5>），按住Shift横向滚动
+        self.game_canvas.bind("<MouseWheel>", lambda e: self.scroll_view(-1 if e.delta > 0 else 1, 0))
+        self.game_canvas.bind("<Shift-MouseWheel>", lambda e: self.scroll_view(0, -1 if e.delta > 0 else 1))
+        self.game_canvas.bind("<Button-4>", lambda e: self.scroll_view(-1, 0))
+        self.game_canvas.bind("<Button-5>", lambda e: self.scroll_view(1, 0))
+        self.game_canvas.bind("<Shift-Button-4>", lambda e: self.scroll_view(0, -1))
+        self.game_canvas.bind("<Shift-Button-5>", lambda e: self.scroll_view(0, 1))
+        for key, (drow, dcol) in (("<Up>", (-1, 0)), ("<Down>", (1, 0)), ("<Left>", (0, -1)), ("<Right>", (0, 1))):
+            self.root.bind(key, lambda e, drow=drow, dcol=dcol: self.scroll_view(drow, dcol))
+        
         # 右侧目标面板
         self.objective_frame = tk.Frame(middle_frame, bg=PANEL_COLOR, padx=10, pady=10)
         self.objective_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=10, pady=10)
@@ -328,6 +619,16 @@ class MatchThreeGame:
             fg=TEXT_COLOR,
             bg=PANEL_COLOR
         ).pack(anchor=tk.W, pady=(0, 10))
+        
+        # 性能叠加层（F3显示时才放到界面上）
+        self.profile_label = tk.Label(
+            self.game_frame,
+            text="",
+            font=("Consolas", 10),
+            justify=tk.LEFT,
+            fg="#00FF00",
+            bg="#000000"
+        )
 
     def confirm_restart(self):
         """确认重新开始游戏"""
@@ -338,8 +639,9 @@ class MatchThreeGame:
         if messagebox.askyesno("确认", "当前进度将丢失，确定重新开始？"):
             self.start_game()
         else:
-            # 如果用户取消，恢复游戏状态
+            # 如果用户取消，恢复游戏状态（步数模拟未完成时仍不接受操作）
             self.game_running = True
+            self.is_processing = self.step_estimate is not None
 
     def _on_resize(self, event):
         """窗口缩放事件（防抖动）"""
@@ -358,14 +660,43 @@ class MatchThreeGame:
         self.window_scale = min(width_ratio, height_ratio)
         self.window_scale = max(self.window_scale, 0.6)
         
-        self.block_size = int(self.dpi.scale(BASE_BLOCK_SIZE) * self.window_scale)
-        self.padding = int(self.dpi.scale(BASE_PADDING) * self.window_scale)
-        self._draw_blocks()
+        # 动画播放中元素带有偏移，等动画结束再缩放
+        if self.is_processing:
+            self.resize_timer = self.root.after(100, lambda: self._do_resize(event))
+            return
         self.resize_timer = None
+        
+        block_size = int(self.dpi.scale(BASE_BLOCK_SIZE) * self.window_scale)
+        padding = int(self.dpi.scale(BASE_PADDING) * self.window_scale)
+        if (block_size, padding) == (self.block_size, self.padding):
+            return
+        self.block_size = block_size
+        self.padding = padding
+        self.pitch = block_size + padding
+        self.atlas.resize(block_size)
+        self._relayout_blocks()
+
+    def _relayout_blocks(self):
+        """按新的布局移动已有画布元素：每个元素一次coords调用，不重新创建
+        
+        贴图已由贴图集原地重绘，这里只需移动位置。
+        """
+        if not self.block_ids:
+            return
+        canvas_size = self.view_size * self.pitch
+        self.game_canvas.config(width=canvas_size, height=canvas_size)
+        coords = self.game_canvas.coords
+        for row in range(self.view_size):
+            block_row = self.block_ids[row]
+            for col in range(self.view_size):
+                x1, y1, _, _ = self._cell_coords(row, col)
+                coords(block_row[col], x1, y1)
 
     def show_start_screen(self):
         """切换到开始界面"""
         # 强制重置状态
+        self.animator.cancel()
+        self._cancel_step_estimate()
         self.game_running = False
         self.is_processing = False
         self.game_frame.pack_forget()
@@ -385,13 +716,42 @@ class MatchThreeGame:
             # 重置游戏状态
             self.score = 0
             self.selected_pos = (-1, -1)
-            self.chain_depth = 0
+            self.hint_cells = []
             self.combo_count = 0
             self.game_running = True
             
-            # 清空画布
+            # 停止未播放完的动画和上一局的步数模拟，清空画布
+            self.animator.cancel()
+            self._cancel_step_estimate()
+            self.item_offsets = {}
             self.game_canvas.delete("all")
             self.block_ids = []
+            self.drawn_grid = []
+            
+            # 棋盘大小与视口（关卡包决定棋盘大小）
+            if self.level_pack is not None:
+                self.grid_size = self.level_pack.grid_size
+            else:
+                self.grid_size = int(self.grid_size_var.get())
+            self.view_size = min(self.grid_size, VIEWPORT_CELLS)
+            self.view_row = self.view_col = 0
+            if self.grid_size > self.view_size:
+                self.y_scrollbar.grid(row=0, column=1, sticky=tk.NS)
+                self.x_scrollbar.grid(row=1, column=0, sticky=tk.EW)
+                self._update_scrollbars()
+            else:
+                self.y_scrollbar.grid_remove()
+                self.x_scrollbar.grid_remove()
+            
+            # 新建规则引擎：关卡包按序号直接载入，否则现场生成
+            if self.engine is not None:
+                self.profiler.release(self.engine)
+            if self.level_pack is not None:
+                self.engine = self.level_pack.make_engine(self.level_index)
+                self.root.title(f"消消乐 - 第{self.level_index + 1}关")
+            else:
+                self.engine = BoardEngine(self.grid_size)
+            self.profiler.install(self.engine, PROFILE_ENGINE_STAGES)
             
             # 初始化随机目标
             self._init_level_objectives()
@@ -401,54 +761,84 @@ class MatchThreeGame:
             
             # 计算并设置步数（在网格生成后进行）
             self._calculate_steps_based_on_grid()
+            self.engine.begin_play()
             
             # 更新界面显示
             self.score_label.config(text=f"分数: {self.score}")
             self.combo_label.config(text="连击: 0")
-            self.step_label.config(text=f"剩余步数: {self.remaining_steps}/{self.max_steps}")
+            if self.step_estimate is not None:
+                self.step_label.config(text="剩余步数: 计算中...")
+            else:
+                self.step_label.config(text=f"剩余步数: {self.remaining_steps}/{self.max_steps}")
         finally:
+            # 步数模拟完成前不接受操作
+            self.is_processing = self.step_estimate is not None
+
+    def _calculate_steps_based_on_grid(self):
+        """模拟试玩当前关卡，按目标通关率计算所需步数"""
+        if self.level_pack is not None:
+            # 关卡包中的步数已在生成时模拟得出
+            self.max_steps = self.engine.max_steps
+            self.remaining_steps = self.engine.remaining_steps
+            return
+        if self.grid_size > MAX_SIMULATED_GRID:
+            self.max_steps = self.engine.calculate_steps_based_on_grid()
+            self.remaining_steps = self.engine.remaining_steps
+            return
+        # 先用经验公式给出步数（模拟失败时沿用），再把模拟试玩交给进程池
+        self.max_steps = self.engine.calculate_steps_based_on_grid()
+        self.remaining_steps = self.engine.remaining_steps
+        try:
+            if self.step_pool is None:
+                self.step_pool = ProcessPoolExecutor(max_workers=STEP_ESTIMATE_WORKERS)
+            futures = submit_difficulty(self.step_pool, self.engine, workers=STEP_ESTIMATE_WORKERS)
+        except (OSError, BrokenProcessPool) as e:
+            self._discard_step_pool(e)
+            return
+        self.step_estimate = (self.engine, futures)
+        self.step_estimate_timer = self.root.after(STEP_ESTIMATE_POLL_MS, self._poll_step_estimate)
+
+    def _poll_step_estimate(self):
+        """定时查看步数模拟是否完成，完成后设置步数并允许操作"""
+        self.step_estimate_timer = None
+        engine, futures = self.step_estimate
+        if not all(future.done() for future in futures):
+            self.step_estimate_timer = self.root.after(STEP_ESTIMATE_POLL_MS, self._poll_step_estimate)
+            return
+        self.step_estimate = None
+        try:
+            self.max_steps = engine.apply_difficulty(collect_difficulty(futures))
+        except BrokenProcessPool as e:
+            self._discard_step_pool(e)
+        finally:
+            self.remaining_steps = engine.remaining_steps
+            self.step_label.config(text=f"剩余步数: {self.remaining_steps}/{self.max_steps}")
             self.is_processing = False
 
-    def _count_element_in_grid(self, element_type):
-        """统计网格中特定元素的数量"""
-        count = 0
-        for row in range(self.grid_size):
-            for col in range(self.grid_size):
-                if self.grid[row][col] == element_type:
-                    count += 1
-        return count
+    def _cancel_step_estimate(self):
+        """放弃进行中的步数模拟（重新开始或返回开始界面时）"""
+        if self.step_estimate_timer is not None:
+            self.root.after_cancel(self.step_estimate_timer)
+            self.step_estimate_timer = None
+        if self.step_estimate is not None:
+            for future in self.step_estimate[1]:
+                future.cancel()
+            self.step_estimate = None
 
-    def _calculate_steps_based_on_grid(self):
-        """根据网格分布和目标计算所需步数"""
-        total_required = sum(obj.required_count for obj in self.objectives)
-        total_available = sum(self._count_element_in_grid(obj.target_type) for obj in self.objectives)
-        
-        # 计算基础步数：目标总数 ÷ 平均每步可消除的数量(约3-4个)
-        base_steps = total_required / 3.5
-        
-        # 根据元素分布调整：元素越分散，需要的步数越多
-        distribution_factor = 1.0
-        for obj in self.objectives:
-            # 检查元素是否分散
-            elements = [(r, c) for r in range(self.grid_size) for c in range(self.grid_size) 
-                       if self.grid[r][c] == obj.target_type]
-            
-            if len(elements) > 0:
-                # 计算元素的分散程度（基于坐标标准差）
-                avg_r = sum(r for r, c in elements) / len(elements)
-                avg_c = sum(c for r, c in elements) / len(elements)
-                
-                std_dev = sum(((r-avg_r)**2 + (c-avg_c)** 2) for r, c in elements) / len(elements)
-                distribution_factor += std_dev / 50  # 标准化分散因子
-        
-        # 综合计算步数
-        calculated_steps = base_steps * distribution_factor * (1 / STEP_CALCULATION_FACTOR)
-        
-        # 确保步数在合理范围内
-        min_possible_steps = max(10, int(total_required / 5))  # 最少步数
-        max_possible_steps = min(80, int(total_required / 2))  # 最多步数
-        self.max_steps = int(max(min_possible_steps, min(max_possible_steps, calculated_steps)))
-        self.remaining_steps = self.max_steps
+    def _discard_step_pool(self, error):
+        """进程池不可用：释放它（下一局重建），本局沿用经验公式的步数"""
+        print(f"步数模拟进程池不可用，改用经验公式: {str(error)}")
+        if self.step_pool is not None:
+            self.step_pool.shutdown(wait=False, cancel_futures=True)
+            self.step_pool = None
+
+    def _on_close(self):
+        """关闭窗口：先释放进程池"""
+        self._cancel_step_estimate()
+        if self.step_pool is not None:
+            self.step_pool.shutdown(wait=False, cancel_futures=True)
+            self.step_pool = None
+        self.root.destroy()
 
     def _init_level_objectives(self):
         """初始化关卡目标"""
@@ -461,13 +851,10 @@ class MatchThreeGame:
         if self.progress_frame and self.progress_frame.winfo_exists():
             self.progress_frame.destroy()
         
-        # 创建新目标（随机类型和数量）
-        target_types = random.sample(REGULAR_ELEMENTS, 3)
-        self.objectives = [
-            LevelObjective(target_types[0], random.randint(MIN_TARGET_COUNT, MAX_TARGET_COUNT)),
-            LevelObjective(target_types[1], random.randint(MIN_TARGET_COUNT, MAX_TARGET_COUNT)),
-            LevelObjective(target_types[2], random.randint(MIN_TARGET_COUNT, MAX_TARGET_COUNT))
-        ]
+        # 创建新目标（随机类型和数量；关卡包已给出目标）
+        if not self.engine.objectives:
+            self.engine.init_level_objectives()
+        self.objectives = self.engine.objectives
         
         # 显示目标（使用中文颜色名称）
         for obj in self.objectives:
@@ -494,9 +881,14 @@ class MatchThreeGame:
         self.level_progress.pack(fill=tk.X)
         self._update_level_progress()
 
-    def _update_level_progress(self):
-        """更新关卡进度"""
-        completed = sum(1 for obj in self.objectives if obj.is_completed())
+    def _update_level_progress(self, counts=None):
+        """更新关卡进度（counts为播放中的目标进度快照）"""
+        if counts is None:
+            counts = [obj.current_count for obj in self.objectives]
+        for i, obj in enumerate(self.objectives):
+            self.objective_labels[i].config(
+                text=f"{obj.target_type.name}: {counts[i]}/{obj.required_count}")
+        completed = sum(1 for obj, count in zip(self.objectives, counts) if count >= obj.required_count)
         progress = int((completed / len(self.objectives)) * 100)
         self.level_progress["value"] = progress
         return completed == len(self.objectives)
@@ -506,104 +898,133 @@ class MatchThreeGame:
         if not self.game_running:
             return
         
-        max_attempts = 150
-        attempts = 0
-        
-        while attempts < max_attempts:
-            # 生成随机网格（只包含普通元素）
-            self.grid = [[random.choice(REGULAR_ELEMENTS) for _ in range(BASE_GRID_SIZE)] 
-                         for _ in range(BASE_GRID_SIZE)]
-            # 检查是否有可消除的组合
-            if not self._find_removable_blocks():
-                self._draw_blocks()
-                return
-            attempts += 1
-        
-        # 多次尝试失败，强制使用当前网格
+        # 构造式生成，保证无初始三连且有可行交换（关卡包已给出网格）
+        if self.level_pack is None:
+            self.engine.generate_valid_grid()
+        self.grid = [row[:] for row in self.engine.grid]
         self._draw_blocks()
-        messagebox.showinfo("提示", "已进入游戏，部分方块可直接消除")
 
     def _draw_blocks(self):
-        """绘制游戏方块"""
+        """绘制视口内的方块：首次创建画布元素，之后只更新与上次绘制不同的格子
+        
+        画布元素只覆盖视口，数量和重绘代价与棋盘大小无关。
+        """
         if not self.game_running:
             return
         
-        # 设置画布大小
-        canvas_size = self.grid_size * (self.block_size + self.padding)
-        self.game_canvas.config(width=canvas_size, height=canvas_size)
-        
         # 首次绘制
         if not self.block_ids:
-            for row in range(self.grid_size):
+            # 设置画布大小
+            canvas_size = self.view_size * self.pitch
+            self.game_canvas.config(width=canvas_size, height=canvas_size)
+            
+            for row in range(self.view_size):
                 row_ids = []
-                for col in range(self.grid_size):
-                    x1 = col * (self.block_size + self.padding)
-                    y1 = row * (self.block_size + self.padding)
-                    x2 = x1 + self.block_size
-                    y2 = y1 + self.block_size
-                    
-                    # 获取颜色
-                    element = self.grid[row][col]
-                    color = element.value if element is not None else BACKGROUND_COLOR
+                for col in range(self.view_size):
+                    x1, y1, _, _ = self._cell_coords(row, col)
                     
-                    # 绘制方块
-                    block_id = self.game_canvas.create_rectangle(
-                        x1, y1, x2, y2,
-                        fill=color,
-                        outline=NORMAL_BORDER,
-                        width=2
+                    # 每格一个图片元素（贴图在下面的差异更新中设置）
+                    block_id = self.game_canvas.create_image(
+                        x1, y1,
+                        anchor=tk.NW,
+                        image=self.atlas.get(None)
                     )
-                    
-                    # 为特殊元素添加标记
-                    if element == ElementType.横向特效:
-                        self.game_canvas.create_line(
-                            x1 + 5, y1 + self.block_size//2,
-                            x2 - 5, y1 + self.block_size//2,
-                            width=3, fill="white"
-                        )
-                    elif element == ElementType.纵向特效:
-                        self.game_canvas.create_line(
-                            x1 + self.block_size//2, y1 + 5,
-                            x1 + self.block_size//2, y2 - 5,
-                            width=3, fill="white"
-                        )
-                    elif element == ElementType.爆炸特效:
-                        self.game_canvas.create_oval(
-                            x1 + 10, y1 + 10,
-                            x2 - 10, y2 - 10,
-                            outline="white", width=3
-                        )
-                    elif element == ElementType.魔力鸟:
-                        self.game_canvas.create_text(
-                            x1 + self.block_size//2, y1 + self.block_size//2,
-                            text="魔", font=("微软雅黑", 12, "bold"), fill="black"
-                        )
-                    
                     row_ids.append(block_id)
                 self.block_ids.append(row_ids)
-        # 更新现有方块
+            self.drawn_grid = [[None] * self.view_size for _ in range(self.view_size)]
+        
+        # 差异更新：只处理视口内元素或边框发生变化的格子
+        # （边框取决于棋盘位置，滚动后同色格子也可能需要换边框）
+        for row in range(self.view_size):
+            for col in range(self.view_size):
+                self._draw_slot(row, col)
+
+    def _cell_coords(self, row, col):
+        """视口中第row行、第col列的格子在画布上的矩形坐标"""
+        x1 = col * self.pitch
+        y1 = row * self.pitch
+        return x1, y1, x1 + self.block_size, y1 + self.block_size
+
+    def _slot(self, row, col):
+        """棋盘格子在视口中的位置，不在视口内返回None"""
+        row -= self.view_row
+        col -= self.view_col
+        if 0 <= row < self.view_size and 0 <= col < self.view_size:
+            return row, col
+        return None
+
+    def _draw_slot(self, row, col):
+        """按显示网格和选中/提示状态重绘视口中的单个格子，与影子网格相同时跳过"""
+        pos = (self.view_row + row, self.view_col + col)
+        if pos == self.selected_pos:
+            border = SELECTED_BORDER
+        elif pos in self.hint_cells:
+            border = HINT_BORDER
         else:
-            for row in range(self.grid_size):
-                for col in range(self.grid_size):
-                    element = self.grid[row][col]
-                    color = element.value if element is not None else BACKGROUND_COLOR
-                    self.game_canvas.itemconfig(self.block_ids[row][col], fill=color)
-                    self.game_canvas.itemconfig(
-                        self.block_ids[row][col],
-                        outline=NORMAL_BORDER,
-                        width=2
-                    )
+            border = NORMAL_BORDER
+        key = (self.grid[pos[0]][pos[1]], border)
+        if key != self.drawn_grid[row][col]:
+            self.drawn_grid[row][col] = key
+            self.game_canvas.itemconfig(self.block_ids[row][col], image=self.atlas.get(*key))
+
+    def _draw_cell(self, row, col):
+        """重绘棋盘上的单个格子（不在视口内则跳过）"""
+        slot = self._slot(row, col)
+        if slot is not None:
+            self._draw_slot(*slot)
+
+    # ---------- 视口滚动 ----------
+    def scroll_view(self, drow, dcol):
+        """把视口移动(drow, dcol)格"""
+        self._scroll_to(self.view_row + drow, self.view_col + dcol)
+
+    def _scroll_to(self, row, col):
+        """把视口左上角移到棋盘(row, col)，只重绘内容发生变化的视口格子"""
+        if not self.game_running or self.is_processing:
+            return
+        limit = self.grid_size - self.view_size
+        row = max(0, min(row, limit))
+        col = max(0, min(col, limit))
+        if (row, col) == (self.view_row, self.view_col):
+            return
+        self.view_row, self.view_col = row, col
+        self._draw_blocks()
+        self._update_scrollbars()
+
+    def _ensure_visible(self, row, col):
+        """滚动视口使棋盘格子可见"""
+        view_row = min(max(self.view_row, row - self.view_size + 1), row)
+        view_col = min(max(self.view_col, col - self.view_size + 1), col)
+        self._scroll_to(view_row, view_col)
+
+    def _on_scrollbar(self, axis, action, amount, unit=None):
+        """滚动条回调：moveto按比例定位，scroll按格或按页移动"""
+        current = self.view_row if axis == "y" else self.view_col
+        if action == "moveto":
+            target = round(float(amount) * self.grid_size)
+        else:
+            target = current + int(amount) * (self.view_size if unit == "pages" else 1)
+        if axis == "y":
+            self._scroll_to(target, self.view_col)
+        else:
+            self._scroll_to(self.view_row, target)
+
+    def _update_scrollbars(self):
+        """按视口位置更新滚动条滑块"""
+        n = self.grid_size
+        self.y_scrollbar.set(self.view_row / n, (self.view_row + self.view_size) / n)
+        self.x_scrollbar.set(self.view_col / n, (self.view_col + self.view_size) / n)
 
     def _get_clicked_block(self, x, y):
         """获取点击的方块位置"""
         if not self.game_running or self.is_processing:
             return (-1, -1)
         
-        col = x // (self.block_size + self.padding)
-        row = y // (self.block_size + self.padding)
+        col = x // self.pitch
+        row = y // self.pitch
         
-        if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
-            return (row, col)
+        if 0 <= row < self.view_size and 0 <= col < self.view_size:
+            return (self.view_row + row, self.view_col + col)
         return (-1, -1)
 
     def _on_block_click(self, event):
@@ -611,6 +1032,8 @@ class MatchThreeGame:
         if self.is_processing or not self.game_running:
             return
         
+        self._clear_hint()
+        
         click_row, click_col = self._get_clicked_block(event.x, event.y)
         
         if (click_row, click_col) == (-1, -1):
@@ -637,545 +1060,254 @@ class MatchThreeGame:
 
     def _is_adjacent(self, r1, c1, r2, c2):
         """判断两个方块是否相邻"""
-        return max(abs(r1 - r2), abs(c1 - c2)) == 1
+        return self.engine.is_adjacent(r1, c1, r2, c2)
 
     def _highlight_block(self, row, col):
         """高亮选中的方块"""
-        self.game_canvas.itemconfig(
-            self.block_ids[row][col],
-            outline=SELECTED_BORDER,
-            width=3
-        )
+        self.selected_pos = (row, col)
+        self._draw_cell(row, col)
 
     def _reset_selected(self):
         """重置选中状态"""
         if self.selected_pos != (-1, -1):
             row, col = self.selected_pos
-            self.game_canvas.itemconfig(
-                self.block_ids[row][col],
-                outline=NORMAL_BORDER,
-                width=2
-            )
-        self.selected_pos = (-1, -1)
+            self.selected_pos = (-1, -1)
+            self._draw_cell(row, col)
 
-    def _swap_blocks(self, r1, c1, r2, c2):
-        """交换两个方块"""
-        self.is_processing = True
-        self._reset_selected()
-        
-        # 保存原始元素用于恢复
-        original1 = self.grid[r1][c1]
-        original2 = self.grid[r2][c2]
-        
-        # 检查是否是魔力鸟交换
-        if original1 == ElementType.魔力鸟 or original2 == ElementType.魔力鸟:
-            self._handle_bird_swap(r1, c1, r2, c2, original1, original2)
+    def toggle_profiler(self):
+        """开关性能剖析和叠加层"""
+        if self.profiler.enabled:
+            self.profiler.disable()
+            if self.profile_timer is not None:
+                self.root.after_cancel(self.profile_timer)
+                self.profile_timer = None
+            self.profile_label.place_forget()
             return
-        
-        # 普通交换
-        self.grid[r1][c1], self.grid[r2][c2] = self.grid[r2][c2], self.grid[r1][c1]
-        self._update_block_color(r1, c1)
-        self._update_block_color(r2, c2)
-        
-        # 延迟检查消除
-        self.root.after(200, lambda: self._check_eliminate(original1, original2, r1, c1, r2, c2))
-
-    def _handle_bird_swap(self, r1, c1, r2, c2, original1, original2):
-        """处理魔力鸟交换"""
-        # 魔力鸟与普通元素交换：消除所有同色元素
-        if original1 == ElementType.魔力鸟 and original2 in REGULAR_ELEMENTS:
-            color_to_clear = original2
-            removable = [(row, col) for row in range(self.grid_size) 
-                         for col in range(self.grid_size) 
-                         if self.grid[row][col] == color_to_clear]
-            self._process_elimination(removable)
-            return
-            
-        if original2 == ElementType.魔力鸟 and original1 in REGULAR_ELEMENTS:
-            color_to_clear = original1
-            removable = [(row, col) for row in range(self.grid_size) 
-                         for col in range(self.grid_size) 
-                         if self.grid[row][col] == color_to_clear]
-            self._process_elimination(removable)
+        self.profiler.enable()
+        self.profiler.install(self, PROFILE_GAME_STAGES)
+        self.profiler.install(self.animator, PROFILE_ANIMATOR_STAGES)
+        if self.engine is not None:
+            self.profiler.install(self.engine, PROFILE_ENGINE_STAGES)
+        self.profile_label.place(x=10, y=60)
+        self._refresh_profile_overlay()
+
+    def _refresh_profile_overlay(self):
+        """刷新叠加层：各阶段调用次数和最近样本的p50/p99"""
+        self.profile_timer = None
+        if not self.profiler.enabled:
             return
-            
-        # 魔力鸟与魔力鸟交换：清空整个棋盘
-        if original1 == ElementType.魔力鸟 and original2 == ElementType.魔力鸟:
-            removable = [(row, col) for row in range(self.grid_size) 
-                         for col in range(self.grid_size)]
-            self._process_elimination(removable)
+        lines = [f"{'阶段':<28}{'次数':>8}{'p50(µs)':>10}{'p99(µs)':>10}"]
+        for stage, count, p50, p99 in self.profiler.summary():
+            lines.append(f"{stage:<30}{count:>8}{p50:>10.1f}{p99:>10.1f}")
+        lines.append("F3 关闭  F4 导出trace")
+        self.profile_label.config(text="\n".join(lines))
+        self.profile_label.lift()
+        self.profile_timer = self.root.after(PROFILE_REFRESH_MS, self._refresh_profile_overlay)
+
+    def export_profile(self):
+        """把已收集的trace导出为Chrome trace-event JSON"""
+        if not self.profiler.events:
             return
-            
-        # 魔力鸟与其他特殊元素交换
-        if original1 == ElementType.魔力鸟 and original2 in [ElementType.横向特效, ElementType.纵向特效, ElementType.爆炸特效]:
-            self.grid[r1][c1], self.grid[r2][c2] = self.grid[r2][c2], self.grid[r1][c1]
-            self._trigger_special_element(r2, c2)
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, time.strftime("%Y%m%d_%H%M%S") + ".json")
+            self.profiler.export_chrome_trace(path)
+            print(f"性能trace已导出: {path}")
+        except Exception as e:
+            print(f"性能trace导出失败: {str(e)}")
+
+    def toggle_turbo(self):
+        """切换加速模式：所有动画在一帧内播完"""
+        self.animator.turbo = not self.animator.turbo
+        self.turbo_button.config(text="加速: 开" if self.animator.turbo else "加速: 关")
+
+    def hint(self):
+        """提示一个可行交换（高亮两个方块）"""
+        if not self.game_running or self.is_processing:
             return
-            
-        if original2 == ElementType.魔力鸟 and original1 in [ElementType.横向特效, ElementType.纵向特效, ElementType.爆炸特效]:
-            self.grid[r1][c1], self.grid[r2][c2] = self.grid[r2][c2], self.grid[r1][c1]
-            self._trigger_special_element(r1, c1)
+        self._clear_hint()
+        move = self.engine.find_hint()
+        if move is None:
             return
+        self.hint_cells = list(move)
+        self._ensure_visible(*move[1])
+        self._ensure_visible(*move[0])
+        for row, col in self.hint_cells:
+            self._draw_cell(row, col)
 
-    def _update_block_color(self, row, col):
-        """更新单个方块的颜色"""
-        element = self.grid[row][col]
-        color = element.value if element is not None else BACKGROUND_COLOR
-        self.game_canvas.itemconfig(self.block_ids[row][col], fill=color)
-
-    def _find_removable_blocks(self):
-        """查找所有可消除的方块 - 改进相同方块检测逻辑"""
-        removable = set()
-        visited = set()
-        
-        for row in range(self.grid_size):
-            for col in range(self.grid_size):
-                current_element = self.grid[row][col]
-                # 只处理普通元素
-                if (row, col) not in visited and current_element is not None and current_element in REGULAR_ELEMENTS:
-                    # 检查水平和垂直方向是否有可消除组合
-                    if self._check_line(row, col, 0, 1) or self._check_line(row, col, 1, 0):
-                        # 找到所有连通的同色元素
-                        connected = self._get_connected_blocks(row, col, visited)
-                        for (r, c) in connected:
-                            removable.add((r, c))
-        
-        return list(removable)
-
-    def _check_line(self, row, col, dr, dc):
-        """检查直线上是否有三连或以上 - 修复边界检测问题"""
-        element = self.grid[row][col]
-        if element is None or element not in REGULAR_ELEMENTS:
-            return False
-            
-        count = 1
-        
-        # 向一个方向检查
-        r, c = row + dr, col + dc
-        while 0 <= r < self.grid_size and 0 <= c < self.grid_size:
-            if self.grid[r][c] == element:
-                count += 1
-                r += dr
-                c += dc
-            else:
-                break
-            
-        # 向相反方向检查
-        r, c = row - dr, col - dc
-        while 0 <= r < self.grid_size and 0 <= c < self.grid_size:
-            if self.grid[r][c] == element:
-                count += 1
-                r -= dr
-                c -= dc
-            else:
-                break
-        
-        return count >= 3
+    def _clear_hint(self):
+        """取消提示高亮"""
+        cells, self.hint_cells = self.hint_cells, []
+        for row, col in cells:
+            self._draw_cell(row, col)
 
-    def _get_connected_blocks(self, start_row, start_col, visited):
-        """获取所有连通的同色方块 - 改进连通性检测"""
-        target = self.grid[start_row][start_col]
-        if target is None or target not in REGULAR_ELEMENTS:
-            return []
-        
-        # 检查上下左右四个方向
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-        
-        queue = [(start_row, start_col)]
-        visited.add((start_row, start_col))
-        connected = [(start_row, start_col)]
-        
-        while queue:
-            row, col = queue.pop(0)
-            for dr, dc in directions:
-                new_row = row + dr
-                new_col = col + dc
-                # 严格检查是否为相同元素
-                if (0 <= new_row < self.grid_size and
-                    0 <= new_col < self.grid_size and
-                    (new_row, new_col) not in visited and
-                    self.grid[new_row][new_col] == target):
-                    visited.add((new_row, new_col))
-                    connected.append((new_row, new_col))
-                    queue.append((new_row, new_col))
-        
-        return connected
-
-    def _check_eliminate(self, orig1, orig2, r1, c1, r2, c2):
-        """检查交换后是否可消除 - 增加二次确认步骤"""
-        if not self.game_running:
-            self.is_processing = False
-            return
+    def _swap_blocks(self, r1, c1, r2, c2):
+        """交换两个方块：由引擎同步结算，界面按时间线播放结果"""
+        self.is_processing = True
+        self._reset_selected()
         
-        # 查找可消除的方块
-        removable = self._find_removable_blocks()
-        
-        # 检查是否有特殊元素需要触发
-        special_removables = []
-        if removable:
-            for (row, col) in removable:
-                element = self.grid[row][col]
-                if element in [ElementType.横向特效, ElementType.纵向特效, ElementType.爆炸特效]:
-                    special_removables.append((row, col))
-        
-        # 处理特殊元素
-        if special_removables:
-            # 先清除基础消除的方块
-            for (row, col) in removable:
-                if (row, col) not in special_removables:
-                    self.grid[row][col] = None
-            
-            self._draw_blocks()
-            self.root.after(200, lambda: self._process_special_elements(special_removables))
-            return
+        result = self.engine.apply_move(r1, c1, r2, c2)
         
-        # 如果没有可消除的方块，恢复原状（不消耗步数）
-        if not removable:
-            self.grid[r1][c1] = orig1
-            self.grid[r2][c2] = orig2
-            self._update_block_color(r1, c1)
-            self._update_block_color(r2, c2)
-            self.is_processing = False
+        # 无效交换：滑过去再滑回来（不消耗步数）
+        if not result.valid:
+            self.animator.add(SWAP_MS, on_frame=self._make_swap_tween(r1, c1, r2, c2))
+            self.animator.add(SWAP_MS, on_frame=self._make_swap_tween(r1, c1, r2, c2, reverse=True),
+                              on_end=self._end_invalid_swap)
             return
         
         # 有有效消除：消耗1步
-        self.remaining_steps -= 1
+        self.remaining_steps = self.engine.remaining_steps
         self.step_label.config(text=f"剩余步数: {self.remaining_steps}/{self.max_steps}")
         
-        # 步数耗尽：直接结束游戏
-        if self.remaining_steps <= 0:
-            self.root.after(500, lambda: self.game_over(False))
-            self.is_processing = False
-            return
-        
-        # 处理普通消除
-        self._process_elimination(removable)
+        if result.swapped:
+            self.animator.add(SWAP_MS, on_frame=self._make_swap_tween(r1, c1, r2, c2),
+                              on_end=lambda: self._end_swap(r1, c1, r2, c2))
+        self._schedule_cascade(result)
 
-    def _process_special_elements(self, special_elements):
-        """处理特殊元素的触发"""
-        if not self.game_running:
-            self.is_processing = False
-            return
-        
-        # 收集所有要消除的方块
-        all_removable = set()
-        
-        for (row, col) in special_elements:
-            element = self.grid[row][col]
-            if element == ElementType.横向特效:
-                # 横向特效：消除整行
-                for c in range(self.grid_size):
-                    all_removable.add((row, c))
-            elif element == ElementType.纵向特效:
-                # 纵向特效：消除整列
-                for r in range(self.grid_size):
-                    all_removable.add((r, col))
-            elif element == ElementType.爆炸特效:
-                # 爆炸特效：消除3x3范围
-                for dr in [-1, 0, 1]:
-                    for dc in [-1, 0, 1]:
-                        r = row + dr
-                        c = col + dc
-                        if 0 <= r < self.grid_size and 0 <= c < self.grid_size:
-                            all_removable.add((r, c))
-        
-        # 执行消除
-        self._process_elimination(list(all_removable))
-
-    def _trigger_special_element(self, row, col):
-        """触发单个特殊元素"""
-        if not self.game_running:
-            self.is_processing = False
-            return
-        
-        element = self.grid[row][col]
-        if element is None:
-            self.is_processing = False
-            return
-            
-        removable = []
-        
-        if element == ElementType.横向特效:
-            # 横向特效：消除整行
-            for c in range(self.grid_size):
-                removable.append((row, c))
-        elif element == ElementType.纵向特效:
-            # 纵向特效：消除整列
-            for r in range(self.grid_size):
-                removable.append((r, col))
-        elif element == ElementType.爆炸特效:
-            # 爆炸特效：消除3x3范围
-            for dr in [-1, 0, 1]:
-                for dc in [-1, 0, 1]:
-                    r = row + dr
-                    c = col + dc
-                    if 0 <= r < self.grid_size and 0 <= c < self.grid_size:
-                        removable.append((r, c))
-        
-        # 执行消除
-        self._process_elimination(removable)
-
-    def _process_elimination(self, removable):
-        """处理消除逻辑"""
-        if not self.game_running:
+    def _schedule_cascade(self, result):
+        """把引擎给出的整个连锁过程排入动画时间线"""
+        for index, step in enumerate(result.steps):
+            self.animator.add(CLEAR_MS, on_start=lambda step=step: self._process_elimination(step))
+            # 关卡完成：最后一轮消除后直接结束
+            if index == len(result.steps) - 1 and result.status == "win":
+                break
+            movers = []
+            self.animator.add(DROP_MS,
+                              on_start=lambda step=step, movers=movers: self._start_drop(step, movers),
+                              on_frame=lambda t, movers=movers: self._tween_movers(movers, t),
+                              on_end=lambda step=step: self._drop_blocks(step))
+            refills = []
+            self.animator.add(REFILL_MS,
+                              on_start=lambda step=step, refills=refills: self._fill_new_blocks(step, refills),
+                              on_frame=lambda t, refills=refills: self._tween_movers(refills, 1 - t),
+                              on_end=self._reset_offsets)
+        self.animator.add(0, on_start=lambda: self._finish_cascade(result))
+
+    def _cell_items(self, row, col):
+        """棋盘格子对应的所有画布元素（不在视口内为空）"""
+        slot = self._slot(row, col)
+        if slot is None:
+            return []
+        return [self.block_ids[slot[0]][slot[1]]]
+
+    def _move_items(self, items, dx, dy):
+        """把画布元素移动到相对原位(dx, dy)的位置"""
+        for item in items:
+            old_dx, old_dy = self.item_offsets.get(item, (0, 0))
+            if (dx, dy) != (old_dx, old_dy):
+                self.game_canvas.move(item, dx - old_dx, dy - old_dy)
+                self.item_offsets[item] = (dx, dy)
+
+    def _reset_offsets(self):
+        """所有动画中的元素回到原位"""
+        for item, (dx, dy) in self.item_offsets.items():
+            if dx or dy:
+                self.game_canvas.move(item, -dx, -dy)
+        self.item_offsets = {}
+
+    def _tween_movers(self, movers, t):
+        """按进度t移动一组元素 [(元素列表, 总dx, 总dy)]"""
+        k = ease(t)
+        for items, dx, dy in movers:
+            self._move_items(items, dx * k, dy * k)
+
+    def _make_swap_tween(self, r1, c1, r2, c2, reverse=False):
+        """两个方块互相滑向对方位置的逐帧回调"""
+        pitch = self.pitch
+        dx, dy = (c2 - c1) * pitch, (r2 - r1) * pitch
+        def on_frame(t):
+            items1, items2 = self._cell_items(r1, c1), self._cell_items(r2, c2)
+            for item in items1 + items2:
+                self.game_canvas.tag_raise(item)
+            self._tween_movers([(items1, dx, dy), (items2, -dx, -dy)], 1 - t if reverse else t)
+        return on_frame
+
+    def _end_swap(self, r1, c1, r2, c2):
+        """交换动画结束：元素回原位，按新位置重新着色"""
+        self._reset_offsets()
+        self._swap_display(r1, c1, r2, c2)
+
+    def _end_invalid_swap(self):
+        """无效交换动画结束"""
+        self._reset_offsets()
+        self.is_processing = False
+
+    def _swap_display(self, r1, c1, r2, c2):
+        """在显示网格中交换两个方块"""
+        self.grid[r1][c1], self.grid[r2][c2] = self.grid[r2][c2], self.grid[r1][c1]
+        self._draw_cell(r1, c1)
+        self._draw_cell(r2, c2)
+
+    def _finish_cascade(self, result):
+        """连锁播放完毕，同步引擎状态并检查游戏结束"""
+        self._reset_offsets()
+        self.grid = [row[:] for row in self.engine.grid]
+        self._draw_blocks()
+        if result.status is not None:
+            self.game_over(result.status == "win")
+        else:
             self.is_processing = False
-            return
+            if result.shuffled:
+                messagebox.showinfo("提示", "没有可以交换的方块了，已自动洗牌")
+
+    def _process_elimination(self, step):
+        """播放消除：清空方块、更新得分和目标"""
+        for (row, col, _) in step.cleared:
+            self.grid[row][col] = None
+        for r, c, elem_type in step.spawned:
+            self.grid[r][c] = elem_type
         
-        # 记录被消除的元素类型
-        eliminated_elements = []
-        for (row, col) in removable:
-            element = self.grid[row][col]
-            if element is not None and element in REGULAR_ELEMENTS:
-                eliminated_elements.append(element)
-        
-        # 计算得分
-        base_points = len(removable) * 10
-        combo_multiplier = 1 + (self.combo_count // 3) * 0.2  # 每3连击增加20%得分
-        total_points = int(base_points * combo_multiplier)
-        self.score += total_points
+        # 更新得分与连击
+        self.score = step.score
+        self.combo_count = step.combo_count
         self.score_label.config(text=f"分数: {self.score}")
-        
-        # 更新连击计数
-        self.combo_count += 1
         self.combo_label.config(text=f"连击: {self.combo_count}")
         
-        # 标记消除的方块
-        for (row, col) in removable:
-            self.grid[row][col] = None
-        
-        # 更新目标进度
-        for elem in eliminated_elements:
-            for obj in self.objectives:
-                if obj.target_type == elem and not obj.is_completed():
-                    obj.add_progress()
-        
         # 更新目标显示
-        for i, obj in enumerate(self.objectives):
-            self.objective_labels[i].config(text=obj.get_progress_text())
-        
-        # 检查关卡是否完成
-        if self._update_level_progress():
-            self.root.after(500, lambda: self.game_over(True))
-            return
+        self._update_level_progress(step.objective_counts)
         
         # 更新显示
         self._draw_blocks()
-        
-        # 延迟执行方块下落
-        self.root.after(300, self._drop_blocks)
 
-    def _generate_special_element(self, pattern, positions):
-        """根据消除模式生成特殊元素"""
-        if not positions:
-            return None
-            
-        # 计算中心位置
-        center_idx = len(positions) // 2
-        center_row, center_col = positions[center_idx]
-        
-        # 根据模式生成特殊元素
-        if pattern == "horizontal_4":  # 横向四连
-            return (center_row, center_col, ElementType.横向特效)
-        elif pattern == "vertical_4":  # 纵向四连
-            return (center_row, center_col, ElementType.纵向特效)
-        elif pattern == "horizontal_5" or pattern == "vertical_5":  # 五连
-            return (center_row, center_col, ElementType.魔力鸟)
-        elif pattern == "l_shape" or pattern == "t_shape":  # L形或T形五连
-            return (center_row, center_col, ElementType.爆炸特效)
-        
-        return None
+    def _start_drop(self, step, movers):
+        """下落动画开始：收集视口内要下落的方块，移到最上层"""
+        pitch = self.pitch
+        for (col, from_row, to_row) in step.drops:
+            items = self._cell_items(from_row, col)
+            if not items:
+                continue
+            for item in items:
+                self.game_canvas.tag_raise(item)
+            movers.append((items, 0, (to_row - from_row) * pitch))
 
-    def _detect_elimination_pattern(self, removable):
-        """检测消除模式，用于生成特殊元素"""
-        if len(removable) < 4:
-            return None, []
-            
-        # 按行和列分组
-        rows = {}
-        cols = {}
-        for (r, c) in removable:
-            if r not in rows:
-                rows[r] = []
-            rows[r].append(c)
-            if c not in cols:
-                cols[c] = []
-            cols[c].append(r)
-        
-        # 检查是否有四连或五连
-        for r, cs in rows.items():
-            cs_sorted = sorted(cs)
-            # 检查连续的列
-            for i in range(len(cs_sorted) - 3):
-                if cs_sorted[i+3] - cs_sorted[i] == 3:  # 四连
-                    return "horizontal_4", [(r, cs_sorted[i]), (r, cs_sorted[i+1]), 
-                                          (r, cs_sorted[i+2]), (r, cs_sorted[i+3])]
-            if len(cs_sorted) >= 5:
-                for i in range(len(cs_sorted) - 4):
-                    if cs_sorted[i+4] - cs_sorted[i] == 4:  # 五连
-                        return "horizontal_5", [(r, cs_sorted[i]), (r, cs_sorted[i+1]), 
-                                              (r, cs_sorted[i+2]), (r, cs_sorted[i+3]), (r, cs_sorted[i+4])]
-        
-        for c, rs in cols.items():
-            rs_sorted = sorted(rs)
-            # 检查连续的行
-            for i in range(len(rs_sorted) - 3):
-                if rs_sorted[i+3] - rs_sorted[i] == 3:  # 四连
-                    return "vertical_4", [(rs_sorted[i], c), (rs_sorted[i+1], c), 
-                                        (rs_sorted[i+2], c), (rs_sorted[i+3], c)]
-            if len(rs_sorted) >= 5:
-                for i in range(len(rs_sorted) - 4):
-                    if rs_sorted[i+4] - rs_sorted[i] == 4:  # 五连
-                        return "vertical_5", [(rs_sorted[i], c), (rs_sorted[i+1], c), 
-                                            (rs_sorted[i+2], c), (rs_sorted[i+3], c), (rs_sorted[i+4], c)]
-        
-        # 检查L形或T形（五连）
-        if len(removable) == 5:
-            positions_set = set(removable)
-            for (r, c) in removable:
-                neighbors = 0
-                # 检查四个方向
-                for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    if (r+dr, c+dc) in positions_set:
-                        neighbors += 1
-                if neighbors >= 3:  # 中心位置至少连接3个方向
-                    if any((r+dr, c+dc) in positions_set for dr, dc in [(-1,-1), (-1,1), (1,-1), (1,1)]):
-                        return "l_shape", removable
-                    else:
-                        return "t_shape", removable
-        
-        return None, []
-
-    def _drop_blocks(self):
-        """重力下落：让元素下落填补空位 - 修复下落逻辑"""
-        if not self.game_running:
-            self.is_processing = False
-            return
-        
-        # 按列处理，确保每个方块都能正确下落
-        for col in range(self.grid_size):
-            # 从底部向上处理，确保下落正确
-            empty_spots = 0
-            for row in range(self.grid_size-1, -1, -1):
-                if self.grid[row][col] is None:
-                    empty_spots += 1
-                elif empty_spots > 0:
-                    # 将方块下移到空位
-                    self.grid[row + empty_spots][col] = self.grid[row][col]
-                    self.grid[row][col] = None
+    def _drop_blocks(self, step):
+        """下落动画结束：元素回原位，按下落后的网格重新着色"""
+        self._reset_offsets()
+        for (col, from_row, to_row) in step.drops:
+            self.grid[to_row][col] = self.grid[from_row][col]
+            self.grid[from_row][col] = None
         
         # 更新显示
         self._draw_blocks()
-        
-        # 延迟填充新元素
-        self.root.after(300, self._fill_new_blocks)
 
-    def _fill_new_blocks(self):
-        """顶部填充：生成新元素填补顶部空位 - 修复新方块生成逻辑"""
-        if not self.game_running:
-            self.is_processing = False
-            return
-        
-        # 填充新元素到顶部空位
-        new_elements_added = False
-        for col in range(self.grid_size):
-            for row in range(self.grid_size):
-                if self.grid[row][col] is None:
-                    # 生成新元素时避免立即形成三连
-                    new_element = self._get_valid_new_element(row, col)
-                    self.grid[row][col] = new_element
-                    new_elements_added = True
+    def _fill_new_blocks(self, step, refills):
+        """填充动画开始：新方块先着色，再从棋盘上方滑入"""
+        for (row, col, element) in step.refills:
+            self.grid[row][col] = element
         
         # 更新显示
         self._draw_blocks()
         
-        # 检查连锁反应
-        if new_elements_added:
-            self.chain_depth += 1
-            if self.chain_depth < MAX_CHAIN_DEPTH:
-                self.root.after(300, self._check_chain_reaction)
-            else:
-                # 超过最大连锁深度，结束连锁
-                self.chain_depth = 0
-                self.is_processing = False
-        else:
-            self.chain_depth = 0
-            self.is_processing = False
-
-    def _get_valid_new_element(self, row, col):
-        """获取有效的新元素，避免在生成时就形成三连"""
-        # 检查当前位置可能的冲突
-        left1 = self.grid[row][col-1] if col > 0 else None
-        left2 = self.grid[row][col-2] if col > 1 else None
-        up1 = self.grid[row-1][col] if row > 0 else None
-        up2 = self.grid[row-2][col] if row > 1 else None
-        
-        # 可能的候选元素
-        candidates = REGULAR_ELEMENTS.copy()
-        
-        # 如果左边已有两个相同元素，排除该元素
-        if left1 is not None and left2 == left1:
-            if left1 in candidates:
-                candidates.remove(left1)
-        
-        # 如果上边已有两个相同元素，排除该元素
-        if up1 is not None and up2 == up1:
-            if up1 in candidates and up1 in candidates:
-                candidates.remove(up1)
-        
-        # 如果没有合适的候选元素（很少见），返回任意元素
-        return random.choice(candidates) if candidates else random.choice(REGULAR_ELEMENTS)
-
-    def _check_chain_reaction(self):
-        """检查连锁反应：新布局是否有可消除的组合 - 增强连锁检测"""
-        if not self.game_running:
-            self.is_processing = False
-            return
-        
-        # 查找可消除的方块
-        removable = self._find_removable_blocks()
-        
-        # 检查是否有特殊元素需要处理
-        special_removables = []
-        if removable:
-            for (row, col) in removable:
-                element = self.grid[row][col]
-                if element in [ElementType.横向特效, ElementType.纵向特效, ElementType.爆炸特效]:
-                    special_removables.append((row, col))
-        
-        if special_removables:
-            # 处理特殊元素
-            for (row, col) in removable:
-                if (row, col) not in special_removables:
-                    self.grid[row][col] = None
-            
-            self._draw_blocks()
-            self.root.after(200, lambda: self._process_special_elements(special_removables))
-            return
-        
-        if removable:
-            # 检测消除模式，生成特殊元素
-            pattern, positions = self._detect_elimination_pattern(removable)
-            special_element = self._generate_special_element(pattern, positions)
-            
-            # 执行消除
-            self._process_elimination(removable)
-            
-            # 如果需要生成特殊元素
-            if special_element:
-                r, c, elem_type = special_element
-                self.root.after(500, lambda: self._replace_with_special(r, c, elem_type))
-                
-            return
-        else:
-            # 没有连锁反应，重置状态
-            self.chain_depth = 0
-            self.is_processing = False
-
-    def _replace_with_special(self, row, col, elem_type):
-        """替换普通元素为特殊元素"""
-        if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
-            self.grid[row][col] = elem_type
-            self._update_block_color(row, col)
+        # 每列新方块从上方依次落下
+        pitch = self.pitch
+        per_col = {}
+        for (_, col, _) in step.refills:
+            per_col[col] = per_col.get(col, 0) + 1
+        for (row, col, _) in step.refills:
+            items = self._cell_items(row, col)
+            if items:
+                refills.append((items, 0, -per_col[col] * pitch))
+        self._tween_movers(refills, 1.0)
 
     def game_over(self, is_win):
         """游戏结束处理"""
@@ -1183,6 +1315,12 @@ class MatchThreeGame:
         self.game_running = False
         self.is_processing = False  # 允许按钮响应
         
+        self._save_replay()
+        
+        # 关卡包：通关后下一局进入下一关（最后一关之后回到第一关）
+        if is_win and self.level_pack is not None:
+            self.level_index = (self.level_index + 1) % len(self.level_pack)
+        
         # 显示结果
         if is_win:
             message = f"恭喜胜利！\n目标全部完成\n本次得分: {self.score}\n剩余步数: {self.remaining_steps}/{self.max_steps}"
@@ -1192,6 +1330,15 @@ class MatchThreeGame:
         # 使用after确保UI更新完成后再显示消息框
         self.root.after(100, lambda: self._show_game_over_message(message, is_win))
 
+    def _save_replay(self):
+        """保存本局录像，失败不影响游戏"""
+        try:
+            os.makedirs(REPLAY_DIR, exist_ok=True)
+            filename = time.strftime("%Y%m%d_%H%M%S") + f"_{self.engine.seed}.m3log"
+            save_session(self.engine, os.path.join(REPLAY_DIR, filename))
+        except Exception as e:
+            print(f"录像保存失败: {str(e)}")
+
     def _show_game_over_message(self, message, is_win):
         """显示游戏结束消息并处理后续操作"""
         result = messagebox.askyesno("游戏结束", f"{message}\n\n是否重新开始？")
@@ -1202,10 +1349,19 @@ class MatchThreeGame:
 
 # -------------------------- 程序入口 --------------------------
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包成exe后进程池需要
     root = tk.Tk()
     try:
         root.option_add("*Font", "微软雅黑 10")
     except Exception:
         pass
-    app = MatchThreeGame(root)
+    
+    # 用法：python 消消乐.py [关卡包文件]
+    level_pack = None
+    if len(sys.argv) > 1:
+        try:
+            level_pack = LevelPack(sys.argv[1])
+        except (OSError, ValueError) as e:
+            print(f"关卡包载入失败，改为随机关卡: {str(e)}")
+    app = MatchThreeGame(root, level_pack)
     root.mainloop()
@@ -0,0 +1,63 @@
+import argparse
+import functools
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from 消消乐引擎 import (BASE_GRID_SIZE, DEFAULT_PLAYOUTS, TARGET_WIN_RATE, PLAYOUT_STEP_LIMIT,
+                      generate_level, write_level_pack, LevelPack)
+
+# -------------------------- 生成配置 --------------------------
+DEFAULT_LEVELS = 1000   # 默认生成的关卡数
+MIN_LEVEL_STEPS = 10    # 步数少于此值的关卡太简单，不收录
+BATCH_FACTOR = 2        # 每批尝试的种子数 = 还差的关卡数 × BATCH_FACTOR
+
+def generate_pack(count, grid_size, first_seed, playouts, workers, min_steps, max_steps, policy):
+    """在进程池中按种子依次生成关卡，收录步数在[min_steps, max_steps]内的前count关（按种子顺序）"""
+    task = functools.partial(generate_level, grid_size=grid_size, playouts=playouts, policy=policy,
+                             step_limit=max_steps, target_win_rate=TARGET_WIN_RATE)
+    levels = []
+    seed = first_seed
+    tried = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while len(levels) < count:
+            batch = range(seed, seed + max((count - len(levels)) * BATCH_FACTOR, workers))
+            seed = batch.stop
+            for level in pool.map(task, batch, chunksize=max(len(batch) // (workers * 4), 1)):
+                tried += 1
+                if level is not None and level[1] >= min_steps and len(levels) < count:
+                    levels.append(level)
+            print(f"已尝试 {tried} 个种子，收录 {len(levels)}/{count} 关")
+    return levels
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="并行预生成消消乐关卡包")
+    parser.add_argument("output", help="关卡包文件路径")
+    parser.add_argument("--count", type=int, default=DEFAULT_LEVELS, help="收录的关卡数")
+    parser.add_argument("--grid-size", type=int, default=BASE_GRID_SIZE, help="网格边长")
+    parser.add_argument("--seed", type=int, default=0, help="起始种子")
+    parser.add_argument("--playouts", type=int, default=DEFAULT_PLAYOUTS, help="每关模拟试玩局数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="进程数")
+    parser.add_argument("--min-steps", type=int, default=MIN_LEVEL_STEPS, help="收录关卡的最少步数")
+    parser.add_argument("--max-steps", type=int, default=PLAYOUT_STEP_LIMIT, help="收录关卡的最多步数")
+    parser.add_argument("--policy", default="random", choices=["random", "greedy"], help="模拟试玩策略")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    levels = generate_pack(args.count, args.grid_size, args.seed, args.playouts, args.workers,
+                           args.min_steps, args.max_steps, args.policy)
+    write_level_pack(args.output, args.grid_size, levels)
+
+    # 读回校验
+    pack = LevelPack(args.output)
+    print(f"已写入 {args.output}：{len(pack)} 关，{os.path.getsize(args.output)} 字节，"
+          f"用时 {time.perf_counter() - start:.1f} 秒")
+    pack.close()
+    return 0
+
+# -------------------------- 程序入口 --------------------------
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,1514 @@
+import os
+import random
+import struct
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，只有向量化检测需要
+    np = None
+
+# -------------------------- 游戏常量定义 --------------------------
+class ElementType(Enum):
+    """元素类型枚举（使用红橙黄绿蓝紫六种易于区分的颜色）"""
+    红色 = "#FF4444"    # 鲜明的红色
+    橙色 = "#FF7700"    # 调整后的橙色，提高区分度
+    黄色 = "#FFDD44"    # 柔和的黄色
+    绿色 = "#00CC66"    # 清新的绿色
+    蓝色 = "#3366FF"    # 鲜明的蓝色
+    紫色 = "#AA33BB"    # 明显的紫色
+    横向特效 = "#FF9800"
+    纵向特效 = "#F44336"
+    爆炸特效 = "#9C27B0"
+    魔力鸟 = "#FFEB3B"
+
+# 规则配置
+BASE_GRID_SIZE = 8
+MAX_CHAIN_DEPTH = 20
+MIN_TARGET_COUNT = 10     # 目标最小数量
+MAX_TARGET_COUNT = 25     # 目标最大数量
+STEP_CALCULATION_FACTOR = 0.7  # 步数计算因子，控制难度
+MIN_INITIAL_MOVES = 3     # 初始网格至少保证的可行交换数
+TARGET_WIN_RATE = 0.6     # 估算步数时期望的通关率
+DEFAULT_PLAYOUTS = 64     # 估算步数时的模拟对局数
+PLAYOUT_STEP_LIMIT = 100  # 单局模拟最多走的步数
+ZOBRIST_SEED = 20250701   # Zobrist随机表的固定种子
+
+# 录像格式：文件头 + 目标列表 + 每步3字节（起点下标、方向）
+REPLAY_MAGIC = b"M3LG"
+REPLAY_VERSION = 3  # 版本3：布置关卡后用种子派生对局阶段的随机数流
+REPLAY_HEADER = struct.Struct("<4sBBQHB")  # 标识, 版本, 网格边长, 种子, 最大步数, 目标数
+REPLAY_OBJECTIVE = struct.Struct("<BH")   # 目标编码, 需要数量
+REPLAY_MOVE = struct.Struct("<HB")        # 起点下标 row*N+col, 方向
+REPLAY_DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # 右、下、左、上
+PLAY_SEED_SALT = 0x5EED  # 对局阶段随机数流的种子 = 关卡种子 ^ PLAY_SEED_SALT
+
+# 关卡包格式：文件头 + 定长记录（种子, 最大步数, 通关率‰, 目标列表, 棋盘编码），按序号直接定位
+PACK_MAGIC = b"M3PK"
+PACK_VERSION = 1
+PACK_HEADER = struct.Struct("<4sBBBI")  # 标识, 版本, 网格边长, 每关目标数, 关卡数
+PACK_LEVEL = struct.Struct("<QHH")      # 种子, 最大步数, 通关率（千分比）
+
+# 普通元素列表（红橙黄绿蓝紫）
+REGULAR_ELEMENTS = [
+    ElementType.红色,
+    ElementType.橙色,
+    ElementType.黄色,
+    ElementType.绿色,
+    ElementType.蓝色,
+    ElementType.紫色
+]
+
+# -------------------------- 元素编码 --------------------------
+# 棋盘内部用小整数编码元素：0为空格，1-6为普通元素，7-10为特殊元素
+EMPTY = 0
+CODE_TO_ELEMENT = [None] + list(ElementType)
+ELEMENT_TO_CODE = {element: code for code, element in enumerate(CODE_TO_ELEMENT) if element is not None}
+CODE_TO_COLOR = [None] + [element.value for element in ElementType]  # 渲染用颜色，空格为None
+NUM_COLORS = len(REGULAR_ELEMENTS)
+REGULAR_CODES = list(range(1, NUM_COLORS + 1))
+HORIZONTAL_CODE = ELEMENT_TO_CODE[ElementType.横向特效]
+VERTICAL_CODE = ELEMENT_TO_CODE[ElementType.纵向特效]
+BOMB_CODE = ELEMENT_TO_CODE[ElementType.爆炸特效]
+BIRD_CODE = ELEMENT_TO_CODE[ElementType.魔力鸟]
+TRIGGER_CODES = (HORIZONTAL_CODE, VERTICAL_CODE, BOMB_CODE)  # 交换即可触发的特殊元素
+
+# 生成网格时预埋的"差一步三连"模板（位于3x3小块内）：三个同色格子 + 能凑成三连的交换
+MOVE_TEMPLATES = [
+    ([(0, 0), (0, 1), (1, 2)], ((0, 2), (1, 2))),
+    ([(0, 1), (0, 2), (1, 0)], ((0, 0), (1, 0))),
+    ([(0, 0), (1, 0), (2, 1)], ((2, 0), (2, 1))),
+    ([(1, 0), (2, 0), (0, 1)], ((0, 0), (0, 1))),
+]
+
+def line_counts(cells, n, i, code):
+    """把编码code放到下标i时，返回(横向连续长度, 纵向连续长度)"""
+    row, col = divmod(i, n)
+    # 横向：向左、向右数连续同色
+    horizontal = 1
+    c = col - 1
+    while c >= 0 and cells[i - col + c] == code:
+        horizontal += 1
+        c -= 1
+    c = col + 1
+    while c < n and cells[i - col + c] == code:
+        horizontal += 1
+        c += 1
+    # 纵向：向上、向下数连续同色
+    vertical = 1
+    j = i - n
+    while j >= 0 and cells[j] == code:
+        vertical += 1
+        j -= n
+    j = i + n
+    while j < n * n and cells[j] == code:
+        vertical += 1
+        j += n
+    return horizontal, vertical
+
+def refill_candidates(left1, left2, up1, up2):
+    """填充空位时可选的颜色：排除会与左边两格或上边两格立即连成三连的颜色"""
+    if left1 != EMPTY and left2 == left1 or up1 != EMPTY and up2 == up1:
+        return [code for code in REGULAR_CODES if not (code == left1 == left2 or code == up1 == up2)]
+    return REGULAR_CODES
+
+def forms_run(cells, n, i, code):
+    """把编码code放到下标i时，是否会与已有的相邻格子连成横向或纵向三连"""
+    horizontal, vertical = line_counts(cells, n, i, code)
+    return horizontal >= 3 or vertical >= 3
+
+# -------------------------- 位棋盘 --------------------------
+# 用Python大整数表示格子集合：第i位对应下标i = row * N + col
+BLAST_TABLES = {}  # 网格边长 → (行掩码, 列掩码, 3x3邻域掩码)
+
+def blast_tables(n):
+    """返回边长n的行掩码、列掩码和每格3x3邻域掩码（按边长缓存）"""
+    tables = BLAST_TABLES.get(n)
+    if tables is None:
+        full_row = (1 << n) - 1
+        row_masks = [full_row << (row * n) for row in range(n)]
+        column = 0
+        for row in range(n):
+            column |= 1 << (row * n)
+        col_masks = [column << col for col in range(n)]
+        neighbourhoods = []
+        for i in range(n * n):
+            row, col = divmod(i, n)
+            rows = row_masks[max(row - 1, 0)] | row_masks[row] | row_masks[min(row + 1, n - 1)]
+            cols = col_masks[max(col - 1, 0)] | col_masks[col] | col_masks[min(col + 1, n - 1)]
+            neighbourhoods.append(rows & cols)
+        tables = BLAST_TABLES[n] = (row_masks, col_masks, neighbourhoods)
+    return tables
+
+def bitboard_edges(n):
+    """返回(全盘掩码, 前N-2列掩码, 后N-2列掩码, 非首列掩码, 非末列掩码)"""
+    _, col_masks, _ = blast_tables(n)
+    full = (1 << (n * n)) - 1
+    first_cols = last_cols = 0
+    for col in range(n - 2):
+        first_cols |= col_masks[col]
+        last_cols |= col_masks[col + 2]
+    return full, first_cols, last_cols, full & ~col_masks[0], full & ~col_masks[n - 1]
+
+def iter_bits(mask):
+    """按从低到高的顺序枚举掩码中置位的下标"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+# -------------------------- Zobrist哈希与置换表 --------------------------
+ZOBRIST_CODES = 16  # 每格预留的编码数（0-10已使用）
+_zobrist_rng = random.Random(ZOBRIST_SEED)
+ZOBRIST_TABLE = []  # 下标 i * ZOBRIST_CODES + code → 64位随机数，按需增长
+
+def zobrist_table(num_cells):
+    """返回至少覆盖num_cells个格子的Zobrist随机表（固定种子，跨进程一致）"""
+    needed = num_cells * ZOBRIST_CODES
+    while len(ZOBRIST_TABLE) < needed:
+        ZOBRIST_TABLE.append(_zobrist_rng.getrandbits(64))
+    return ZOBRIST_TABLE
+
+def zobrist_hash(cells):
+    """从头计算格子编码序列的Zobrist哈希"""
+    table = zobrist_table(len(cells))
+    h = 0
+    for i, code in enumerate(cells):
+        h ^= table[i * ZOBRIST_CODES + code]
+    return h
+
+class TranspositionCache:
+    """按最近使用淘汰的置换表，保存局面的估值结果"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """查找并标记为最近使用，不存在返回None"""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """写入结果，超出容量时淘汰最久未用的局面"""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+# -------------------------- 关卡目标类 --------------------------
+class LevelObjective:
+    """关卡目标类"""
+    def __init__(self, target_type, required_count):
+        self.target_type = target_type  # 目标元素类型
+        self.required_count = required_count  # 需要收集的数量
+        self.current_count = 0  # 当前收集数量
+
+    def is_completed(self):
+        """检查目标是否完成"""
+        return self.current_count >= self.required_count
+
+    def add_progress(self, count=1):
+        """增加进度"""
+        self.current_count = min(self.current_count + count, self.required_count)
+
+    def get_progress_text(self):
+        """获取进度文本（使用中文颜色名称）"""
+        return f"{self.target_type.name}: {self.current_count}/{self.required_count}"
+
+# -------------------------- 紧凑棋盘 --------------------------
+class Board:
+    """紧凑棋盘：按行优先存放在一块bytearray中，每格一个元素编码
+
+    所有写入都经过set_index：记录被改动的行和列（脏区域），消除检测只需重新扫描这些行列；
+    同时增量维护64位Zobrist哈希，每次写入只需两次异或；
+    并维护每种编码的数量、行号和、列号和、到原点距离平方和，计数、重心和分散度都是O(1)读取。
+    """
+    def __init__(self, size, cells=None):
+        self.size = size
+        self.cells = bytearray(size * size)
+        self.dirty_rows = set()
+        self.dirty_cols = set()
+        self.zobrist = zobrist_table(size * size)
+        self.hash = 0
+        self.load(cells if cells is not None else bytes(size * size))
+
+    def load(self, cells):
+        """整体载入格子编码，重新计算哈希和统计量，并把所有行列标记为脏
+
+        格子数与棋盘不符或含有未知编码时抛出ValueError，棋盘保持不变。
+        """
+        if len(cells) != self.size * self.size:
+            raise ValueError(f"格子数{len(cells)}与{self.size}x{self.size}的棋盘不符")
+        if cells and max(cells) >= len(CODE_TO_ELEMENT):
+            raise ValueError(f"未知的格子编码{max(cells)}")
+        self.cells[:] = cells
+        self.hash = zobrist_hash(self.cells)
+        n = self.size
+        size = len(CODE_TO_ELEMENT)
+        self.counts = [0] * size        # 编码 → 格子数
+        self.row_sums = [0] * size      # 编码 → 行号之和
+        self.col_sums = [0] * size      # 编码 → 列号之和
+        self.square_sums = [0] * size   # 编码 → 行号平方+列号平方之和
+        for i, code in enumerate(self.cells):
+            row, col = divmod(i, n)
+            self.counts[code] += 1
+            self.row_sums[code] += row
+            self.col_sums[code] += col
+            self.square_sums[code] += row * row + col * col
+        self.mark_all_dirty()
+
+    def mark_all_dirty(self):
+        """标记所有行列需要重新扫描"""
+        self.dirty_rows = set(range(self.size))
+        self.dirty_cols = set(range(self.size))
+
+    def take_dirty(self):
+        """取出并清空脏行、脏列"""
+        rows, cols = self.dirty_rows, self.dirty_cols
+        self.dirty_rows = set()
+        self.dirty_cols = set()
+        return rows, cols
+
+    def get(self, row, col):
+        """读取格子编码"""
+        return self.cells[row * self.size + col]
+
+    def set_index(self, i, code):
+        """按下标写入格子编码（唯一的写入入口）"""
+        old = self.cells[i]
+        base = i * ZOBRIST_CODES
+        self.hash ^= self.zobrist[base + old] ^ self.zobrist[base + code]
+        self.cells[i] = code
+        row, col = divmod(i, self.size)
+        self.dirty_rows.add(row)
+        self.dirty_cols.add(col)
+        square = row * row + col * col
+        self.counts[old] -= 1
+        self.counts[code] += 1
+        self.row_sums[old] -= row
+        self.row_sums[code] += row
+        self.col_sums[old] -= col
+        self.col_sums[code] += col
+        self.square_sums[old] -= square
+        self.square_sums[code] += square
+
+    def set(self, row, col, code):
+        """写入格子编码"""
+        self.set_index(row * self.size + col, code)
+
+    def element(self, row, col):
+        """读取格子对应的ElementType（空格为None）"""
+        return CODE_TO_ELEMENT[self.cells[row * self.size + col]]
+
+    def set_element(self, row, col, element):
+        """按ElementType写入格子"""
+        self.set(row, col, ELEMENT_TO_CODE[element] if element is not None else EMPTY)
+
+    def swap(self, r1, c1, r2, c2):
+        """交换两个格子"""
+        i, j = r1 * self.size + c1, r2 * self.size + c2
+        code_i, code_j = self.cells[i], self.cells[j]
+        self.set_index(i, code_j)
+        self.set_index(j, code_i)
+
+    def count(self, code):
+        """统计某种编码的格子数"""
+        return self.counts[code]
+
+    def centroid(self, code):
+        """某种编码的重心(平均行号, 平均列号)，没有该编码时返回None"""
+        k = self.counts[code]
+        if not k:
+            return None
+        return self.row_sums[code] / k, self.col_sums[code] / k
+
+    def spread(self, code):
+        """某种编码到其重心的平均距离平方（分散度），没有该编码时返回0"""
+        k = self.counts[code]
+        if not k:
+            return 0.0
+        avg_r = self.row_sums[code] / k
+        avg_c = self.col_sums[code] / k
+        return max(self.square_sums[code] / k - avg_r * avg_r - avg_c * avg_c, 0.0)
+
+    def indices_of(self, code):
+        """某种编码所在的全部下标（升序）"""
+        cells = self.cells
+        found = []
+        i = cells.find(code)
+        while i >= 0:
+            found.append(i)
+            i = cells.find(code, i + 1)
+        return found
+
+    def drop_columns(self):
+        """可能需要下落或填充的列（升序）：上次消除检测以来被改动过的列"""
+        return sorted(self.dirty_cols)
+
+    def copy(self):
+        """复制棋盘（包括脏区域和哈希）"""
+        board = type(self).__new__(type(self))
+        board.size = self.size
+        board.cells = bytearray(self.cells)
+        board.dirty_rows = set(self.dirty_rows)
+        board.dirty_cols = set(self.dirty_cols)
+        board.zobrist = self.zobrist
+        board.hash = self.hash
+        board.counts = list(self.counts)
+        board.row_sums = list(self.row_sums)
+        board.col_sums = list(self.col_sums)
+        board.square_sums = list(self.square_sums)
+        return board
+
+    def to_grid(self):
+        """转换为ElementType二维列表（供界面使用）"""
+        n = self.size
+        return [[CODE_TO_ELEMENT[code] for code in self.cells[row * n:(row + 1) * n]] for row in range(n)]
+
+    @classmethod
+    def from_grid(cls, grid):
+        """由ElementType二维列表构建棋盘"""
+        return cls(len(grid), bytes(ELEMENT_TO_CODE[e] if e is not None else EMPTY for row in grid for e in row))
+
+class BitBoard(Board):
+    """位棋盘后端：在紧凑棋盘之外，为每种编码维护一个大整数掩码（第i位对应下标i）
+
+    三连检测、魔力鸟清色和元素计数都变成整数位运算，不再逐格扫描，
+    适合8x8等小棋盘上的大量模拟和搜索。掩码随set_index增量更新。
+    """
+    def load(self, cells):
+        """整体载入格子编码并重建各编码的掩码"""
+        super().load(cells)
+        self.masks = [0] * len(CODE_TO_ELEMENT)
+        for i, code in enumerate(self.cells):
+            self.masks[code] |= 1 << i
+        self.edges = bitboard_edges(self.size)
+
+    def set_index(self, i, code):
+        """按下标写入格子编码，同时移动该位所属的掩码"""
+        bit = 1 << i
+        self.masks[self.cells[i]] ^= bit
+        self.masks[code] ^= bit
+        super().set_index(i, code)
+
+    def indices_of(self, code):
+        """某种编码所在的全部下标（升序）"""
+        return list(iter_bits(self.masks[code]))
+
+    def drop_columns(self):
+        """需要下落或填充的列（升序）：含有空格的列"""
+        n = self.size
+        return sorted({i % n for i in iter_bits(self.masks[EMPTY])})
+
+    def removable_mask(self):
+        """全盘三连所在的同色连通块掩码
+
+        横向三连为 b & (b >> 1) & (b >> 2)（起点限制在前N-2列），纵向同理移位N；
+        再在该颜色的掩码内逐层扩张得到整个连通块。
+        """
+        n = self.size
+        _, run_starts, _, not_first, not_last = self.edges
+        removable = 0
+        for code in REGULAR_CODES:
+            b = self.masks[code]
+            if not b:
+                continue
+            h = b & (b >> 1) & (b >> 2) & run_starts
+            v = b & (b >> n) & (b >> (2 * n))
+            component = h | (h << 1) | (h << 2) | v | (v << n) | (v << (2 * n))
+            if not component:
+                continue
+            while True:
+                grown = (component | ((component << 1) & not_first) | ((component >> 1) & not_last)
+                         | (component << n) | (component >> n)) & b
+                if grown == component:
+                    break
+                component = grown
+            removable |= component
+        return removable
+
+    def legal_move_masks(self):
+        """可行交换掩码(右移, 下移)：第i位表示交换i与i+1（或i与i+N）能产生消除
+
+        对每种颜色，分别求“从左/右/上/下移入一格后，该格与其余三个方向上的同色格连成三连”
+        的目标格集合；特殊元素与任何非空相邻格交换都有效。
+        """
+        n = self.size
+        full, first_cols, last_cols, not_first, not_last = self.edges
+        middle = not_first & not_last
+        occupied = full & ~self.masks[EMPTY]
+        right = down = 0
+        for code in REGULAR_CODES:
+            b = self.masks[code]
+            if not b:
+                continue
+            # 目标格左边两格/右边两格/左右各一格/上两格/下两格/上下各一格同色
+            left2 = (b << 1) & (b << 2) & last_cols
+            right2 = (b >> 1) & (b >> 2) & first_cols
+            across = (b << 1) & (b >> 1) & middle
+            up2 = (b << n) & (b << (2 * n))
+            down2 = (b >> n) & (b >> (2 * n))
+            through = (b << n) & (b >> n)
+            targets = occupied & ~b
+            # 从左边移入 / 从右边移入 / 从上边移入 / 从下边移入
+            right |= (((b << 1) & not_first & targets & (right2 | up2 | down2 | through)) >> 1)
+            right |= (b >> 1) & not_last & targets & (left2 | up2 | down2 | through)
+            down |= ((b << n) & targets & (left2 | right2 | across | down2)) >> n
+            down |= (b >> n) & targets & (left2 | right2 | across | up2)
+        specials = self.masks[HORIZONTAL_CODE] | self.masks[VERTICAL_CODE] | self.masks[BOMB_CODE] | self.masks[BIRD_CODE]
+        if specials:
+            right |= (specials | (specials >> 1)) & not_last & occupied & (occupied >> 1)
+            down |= (specials | (specials >> n)) & occupied & (occupied >> n)
+        return right & full, down & full
+
+    def copy(self):
+        """复制棋盘（包括掩码）"""
+        board = super().copy()
+        board.masks = list(self.masks)
+        board.edges = self.edges
+        return board
+
+BOARD_BACKENDS = {"bytes": Board, "bitboard": BitBoard}  # 棋盘后端
+
+# -------------------------- 交换结果 --------------------------
+class CascadeStep:
+    """一轮消除的完整记录：消除 → 生成特效 → 下落 → 填充"""
+    def __init__(self):
+        self.cleared = []  # 被消除的方块 [(row, col, element)]
+        self.spawned = []  # 生成的特殊元素 [(row, col, element)]
+        self.drops = []  # 下落记录 [(col, from_row, to_row)]
+        self.refills = []  # 新填充的方块 [(row, col, element)]
+        self.points = 0  # 本轮得分
+        self.score = 0  # 本轮结束后的总分
+        self.combo_count = 0  # 本轮结束后的连击数
+        self.objective_counts = []  # 本轮结束后各目标的进度
+
+class MoveResult:
+    """一次交换的结算结果，界面只需按顺序播放"""
+    def __init__(self, r1, c1, r2, c2):
+        self.move = (r1, c1, r2, c2)
+        self.valid = False  # 是否为有效交换（无效交换不消耗步数）
+        self.swapped = False  # 两个方块是否互换了位置
+        self.steps = []  # 连锁过程 [CascadeStep]
+        self.score_gained = 0
+        self.status = None  # None / "win" / "lose"
+        self.shuffled = False  # 连锁结束后是否因无可行交换而重新洗牌
+
+# -------------------------- 棋盘引擎 --------------------------
+class BoardEngine:
+    """与界面无关的三消规则引擎，同步结算整次连锁"""
+    def __init__(self, grid_size=BASE_GRID_SIZE, rng=None, seed=None, backend="bytes"):
+        self.grid_size = grid_size
+        self.backend = backend  # 棋盘后端，见BOARD_BACKENDS
+        # 每局独立的随机数流：给定seed即可完整复现（外部传入rng时无法录像回放）
+        if rng is None:
+            seed = seed if seed is not None else random.getrandbits(32)
+            rng = random.Random(seed)
+        self.seed = seed
+        self.rng = rng
+        self.move_log = []  # 有效交换记录 [(r1, c1, r2, c2)]
+        self.board = BOARD_BACKENDS[backend](grid_size)
+        self.objectives = []
+        self.score = 0
+        self.combo_count = 0  # 连击计数
+        self.remaining_steps = 0
+        self.max_steps = 0
+        self.status = None
+
+    def clone(self, rng=None):
+        """复制引擎状态（棋盘、目标进度、分数与步数），供搜索和模拟使用（不复制录像）
+
+        搜索时每个节点都要复制一次，因此绕过__init__，免得新建一块马上被替换掉的空棋盘。
+        """
+        engine = BoardEngine.__new__(BoardEngine)
+        engine.grid_size = self.grid_size
+        engine.backend = self.backend
+        engine.seed = None  # 副本使用外部rng，不能录像回放
+        engine.rng = rng if rng is not None else self.rng
+        engine.move_log = []
+        engine.board = self.board.copy()
+        engine.objectives = []
+        for obj in self.objectives:
+            copied = LevelObjective(obj.target_type, obj.required_count)
+            copied.current_count = obj.current_count
+            engine.objectives.append(copied)
+        engine.score = self.score
+        engine.combo_count = self.combo_count
+        engine.remaining_steps = self.remaining_steps
+        engine.max_steps = self.max_steps
+        engine.status = self.status
+        return engine
+
+    @property
+    def grid(self):
+        """ElementType二维列表形式的棋盘副本"""
+        return self.board.to_grid()
+
+    @grid.setter
+    def grid(self, grid):
+        self.board = BOARD_BACKENDS[self.backend].from_grid(grid)
+
+    # ---------- 关卡初始化 ----------
+    def init_level_objectives(self):
+        """初始化关卡目标（随机类型和数量）"""
+        target_types = self.rng.sample(REGULAR_ELEMENTS, 3)
+        self.objectives = [
+            LevelObjective(target_type, self.rng.randint(MIN_TARGET_COUNT, MAX_TARGET_COUNT))
+            for target_type in target_types
+        ]
+        return self.objectives
+
+    def generate_valid_grid(self, min_moves=MIN_INITIAL_MOVES, seed=None):
+        """构造式生成初始网格：保证没有可直接消除的组合，且至少有min_moves个可行交换
+
+        先在互不重叠的3x3小块里预埋"差一步三连"模板，再按行优先一次填满其余格子，
+        每格只从不会凑成三连的颜色中抽取（横纵向最多排除4种颜色，总有候选）。
+        返回预埋的可行交换列表 [((r1, c1), (r2, c2))]。
+        """
+        rng = random.Random(seed) if seed is not None else self.rng
+        n = self.grid_size
+        tiles = [(tr * 3, tc * 3) for tr in range(n // 3) for tc in range(n // 3)]
+        if min_moves > len(tiles):
+            raise ValueError(f"{n}x{n}的网格最多只能保证{len(tiles)}个可行交换")
+        rng.shuffle(tiles)
+
+        cells = bytearray(n * n)
+        moves = []
+        for top, left in tiles:
+            if len(moves) >= min_moves:
+                break
+            offsets, (a, b) = rng.choice(MOVE_TEMPLATES)
+            positions = [(top + dr) * n + left + dc for dr, dc in offsets]
+            # 模板颜色不能与已预埋的格子连成三连
+            colors = [code for code in REGULAR_CODES if self._template_fits(cells, positions, code)]
+            if not colors:
+                continue
+            code = rng.choice(colors)
+            for i in positions:
+                cells[i] = code
+            moves.append(((top + a[0], left + a[1]), (top + b[0], left + b[1])))
+        if len(moves) < min_moves:
+            raise ValueError(f"无法在{n}x{n}的网格中预埋{min_moves}个可行交换")
+
+        # 一次线性填充：排除会与相邻格子（包括右侧、下方已预埋的格子）凑成三连的颜色
+        for i in range(n * n):
+            if cells[i] == EMPTY:
+                cells[i] = rng.choice([code for code in REGULAR_CODES if not forms_run(cells, n, i, code)])
+
+        self.board.load(cells)
+        self.board.take_dirty()  # 构造保证没有三连，无需再扫描
+        return moves
+
+    def _template_fits(self, cells, positions, code):
+        """逐格试放模板，检查是否会与已预埋的格子连成三连（试放后恢复）"""
+        n = self.grid_size
+        placed = []
+        fits = True
+        for i in positions:
+            if forms_run(cells, n, i, code):
+                fits = False
+                break
+            cells[i] = code
+            placed.append(i)
+        for i in placed:
+            cells[i] = EMPTY
+        return fits
+
+    def count_element_in_grid(self, element_type):
+        """统计网格中特定元素的数量"""
+        return self.board.count(ELEMENT_TO_CODE[element_type])
+
+    def calculate_steps_based_on_grid(self):
+        """根据网格分布和目标计算所需步数"""
+        total_required = sum(obj.required_count for obj in self.objectives)
+
+        # 计算基础步数：目标总数 ÷ 平均每步可消除的数量(约3-4个)
+        base_steps = total_required / 3.5
+
+        # 根据元素分布调整：元素越分散，需要的步数越多
+        distribution_factor = 1.0
+        for obj in self.objectives:
+            # 元素的分散程度（棋盘维护的到重心的平均距离平方）
+            std_dev = self.board.spread(ELEMENT_TO_CODE[obj.target_type])
+            distribution_factor += std_dev / 50  # 标准化分散因子
+
+        # 综合计算步数
+        calculated_steps = base_steps * distribution_factor * (1 / STEP_CALCULATION_FACTOR)
+
+        # 确保步数在合理范围内
+        min_possible_steps = max(10, int(total_required / 5))  # 最少步数
+        max_possible_steps = int(total_required / 2)  # 最多步数
+
+        self.max_steps = int(max(min_possible_steps, min(max_possible_steps, calculated_steps)))
+        self.remaining_steps = self.max_steps
+        return self.max_steps
+
+    def estimate_max_steps(self, target_win_rate=TARGET_WIN_RATE, **kwargs):
+        """用蒙特卡洛模拟代替经验公式：取达到目标通关率所需的最少步数"""
+        return self.apply_difficulty(estimate_difficulty(self, **kwargs), target_win_rate)
+
+    def apply_difficulty(self, estimate, target_win_rate=TARGET_WIN_RATE):
+        """按模拟结果设置步数：取达到目标通关率所需的最少步数"""
+        self.max_steps = estimate.steps_for_win_rate(target_win_rate)
+        self.remaining_steps = self.max_steps
+        return self.max_steps
+
+    def begin_play(self):
+        """关卡布置完成、开始对局：用关卡种子派生对局阶段的随机数流
+
+        之后补充方块的随机结果只取决于种子，与关卡是现场生成还是从关卡包载入无关。
+        外部传入rng（没有种子）时不做改动。
+        """
+        if self.seed is not None:
+            self.rng = random.Random(self.seed ^ PLAY_SEED_SALT)
+
+    def is_level_completed(self):
+        """所有目标是否都已完成"""
+        return all(obj.is_completed() for obj in self.objectives)
+
+    # ---------- 消除检测 ----------
+    def find_removable_blocks(self):
+        """查找所有可消除的方块（三连所在的整个同色连通块），只检查脏行列"""
+        n = self.grid_size
+        return [divmod(i, n) for i in self._find_removable_indices()]
+
+    def _find_removable_indices(self):
+        """只扫描上次检测后被改动过的行和列，返回可消除格子的下标集合
+
+        稳定棋盘上不存在三连，新三连只可能出现在被写入过的行列中，
+        因此一次连锁的代价与改动量成正比，而不是与棋盘面积成正比。
+        """
+        n = self.grid_size
+        dirty_rows, dirty_cols = self.board.take_dirty()
+        if self.backend == "bitboard":
+            return set(iter_bits(self.board.removable_mask()))
+        seeds = []
+        for row in dirty_rows:
+            self._scan_line(row * n, 1, n, seeds)
+        for col in dirty_cols:
+            self._scan_line(col, n, n, seeds)
+        return self._expand_connected(seeds)
+
+    def _scan_line(self, start, stride, length, out):
+        """按游程扫描一条直线，把长度≥3的普通元素游程下标追加到out"""
+        cells = self.board.cells
+        run_start = 0
+        run_code = cells[start]
+        for k in range(1, length + 1):
+            code = cells[start + k * stride] if k < length else EMPTY
+            if code != run_code:
+                if k - run_start >= 3 and 0 < run_code <= NUM_COLORS:
+                    out.extend(range(start + run_start * stride, start + k * stride, stride))
+                run_start = k
+                run_code = code
+
+    def _expand_connected(self, seeds):
+        """从三连格子出发，扩展到整个同色连通块"""
+        n = self.grid_size
+        cells = self.board.cells
+        removable = set()
+        for seed in seeds:
+            if seed in removable:
+                continue
+            target = cells[seed]
+            removable.add(seed)
+            stack = [seed]
+            while stack:
+                i = stack.pop()
+                col = i % n
+                if col > 0 and cells[i - 1] == target and i - 1 not in removable:
+                    removable.add(i - 1)
+                    stack.append(i - 1)
+                if col < n - 1 and cells[i + 1] == target and i + 1 not in removable:
+                    removable.add(i + 1)
+                    stack.append(i + 1)
+                if i >= n and cells[i - n] == target and i - n not in removable:
+                    removable.add(i - n)
+                    stack.append(i - n)
+                if i + n < n * n and cells[i + n] == target and i + n not in removable:
+                    removable.add(i + n)
+                    stack.append(i + n)
+        return removable
+
+    # ---------- 特殊元素 ----------
+    def _blast_mask(self, i, code):
+        """特殊元素的消除范围掩码（非横向/纵向/爆炸特效为0）"""
+        n = self.grid_size
+        row_masks, col_masks, neighbourhoods = blast_tables(n)
+        if code == HORIZONTAL_CODE:
+            # 横向特效：消除整行
+            return row_masks[i // n]
+        elif code == VERTICAL_CODE:
+            # 纵向特效：消除整列
+            return col_masks[i % n]
+        elif code == BOMB_CODE:
+            # 爆炸特效：消除3x3范围
+            return neighbourhoods[i]
+        return 0
+
+    def get_special_blast(self, row, col):
+        """计算特殊元素的消除范围"""
+        n = self.grid_size
+        mask = self._blast_mask(row * n + col, self.board.get(row, col))
+        return [divmod(i, n) for i in iter_bits(mask)]
+
+    def resolve_blasts(self, removable):
+        """计算消除范围的爆炸闭包：范围内的横向/纵向/爆炸特效被波及时一并触发
+
+        一次工作表遍历：每个特效只触发一次，只检查新加入范围的格子，
+        代价与受影响的格子数成正比。魔力鸟被波及时直接消除，不触发。
+        """
+        n = self.grid_size
+        cells = self.board.cells
+        cleared = 0
+        pending = []
+        for (row, col) in removable:
+            i = row * n + col
+            bit = 1 << i
+            if not cleared & bit:
+                cleared |= bit
+                if cells[i] in TRIGGER_CODES:
+                    pending.append(i)
+        if not pending:
+            return removable
+
+        while pending:
+            i = pending.pop()
+            new = self._blast_mask(i, cells[i]) & ~cleared
+            cleared |= new
+            for j in iter_bits(new):
+                if cells[j] in TRIGGER_CODES:
+                    pending.append(j)
+        return [divmod(i, n) for i in iter_bits(cleared)]
+
+    def _special_swap_removable(self, r1, c1, r2, c2):
+        """特殊元素参与的交换，返回(要消除的方块, 是否互换位置)；普通交换返回(None, False)"""
+        n = self.grid_size
+        code1 = self.board.get(r1, c1)
+        code2 = self.board.get(r2, c2)
+
+        # 魔力鸟与魔力鸟交换：清空整个棋盘
+        if code1 == BIRD_CODE and code2 == BIRD_CODE:
+            return [divmod(i, n) for i in range(n * n)], False
+
+        # 魔力鸟与普通元素交换：消除所有同色元素（连同魔力鸟本身）
+        for bird, other, bird_pos in ((code1, code2, (r1, c1)), (code2, code1, (r2, c2))):
+            if bird == BIRD_CODE and 0 < other <= NUM_COLORS:
+                removable = [divmod(i, n) for i in self.board.indices_of(other)]
+                removable.append(bird_pos)
+                return removable, False
+
+        # 魔力鸟与其他特殊元素交换：交换后触发该特殊元素（连同魔力鸟本身）
+        if code1 == BIRD_CODE and code2 in TRIGGER_CODES or code2 == BIRD_CODE and code1 in TRIGGER_CODES:
+            self.board.swap(r1, c1, r2, c2)
+            special_pos, bird_pos = ((r1, c1), (r2, c2)) if code2 in TRIGGER_CODES else ((r2, c2), (r1, c1))
+            removable = self.get_special_blast(*special_pos)
+            removable.append(bird_pos)
+            return removable, True
+
+        # 横向/纵向/爆炸特效与相邻方块交换：交换后触发（两个都是特效则一起触发）
+        if code1 in TRIGGER_CODES or code2 in TRIGGER_CODES:
+            self.board.swap(r1, c1, r2, c2)
+            removable = set()
+            if code1 in TRIGGER_CODES:
+                removable.update(self.get_special_blast(r2, c2))
+            if code2 in TRIGGER_CODES:
+                removable.update(self.get_special_blast(r1, c1))
+            return list(removable), True
+
+        return None, False
+
+    def detect_elimination_patterns(self, removable):
+        """检测消除模式，用于生成特殊元素
+
+        消除范围先按同色连通块分组，每块单独分类，返回[(模式, 位置列表)]，
+        每个能生成特殊元素的连通块一项；同时出现的多个形状各自生成。
+        """
+        n = self.grid_size
+        cells = self.board.cells
+        indices = sorted(row * n + col for (row, col) in removable)
+        pending = set(indices)
+        patterns = []
+        for seed in indices:
+            if seed not in pending:
+                continue
+            pending.remove(seed)
+            code = cells[seed]
+            component = [seed]
+            stack = [seed]
+            while stack:
+                i = stack.pop()
+                col = i % n
+                for j in (i - 1 if col > 0 else -1, i + 1 if col < n - 1 else -1, i - n, i + n):
+                    if j in pending and cells[j] == code:
+                        pending.remove(j)
+                        component.append(j)
+                        stack.append(j)
+            if len(component) >= 4:
+                shape = self._classify_component(component)
+                if shape is not None:
+                    patterns.append(shape)
+        return patterns
+
+    def _classify_component(self, component):
+        """用游程长度一次线性扫描给连通块分类，返回(模式, 位置列表)，无特殊形状返回None
+
+        每格记下所在横向、纵向游程的(起点, 长度)；优先级：五连 > 十字/T形/L形 > 四连。
+        """
+        n = self.grid_size
+        members = set(component)
+        h_run = {}  # 下标 → 所在横向游程(起点, 长度)
+        v_run = {}  # 下标 → 所在纵向游程(起点, 长度)
+        for i in component:
+            if i % n == 0 or i - 1 not in members:
+                length = 1
+                while (i + length) % n and i + length in members:
+                    length += 1
+                for k in range(length):
+                    h_run[i + k] = (i, length)
+            if i - n not in members:
+                length = 1
+                while i + length * n in members:
+                    length += 1
+                for k in range(length):
+                    v_run[i + k * n] = (i, length)
+
+        # 五连（取最长的游程）
+        h_best = max(sorted(set(h_run.values())), key=lambda run: run[1])
+        v_best = max(sorted(set(v_run.values())), key=lambda run: run[1])
+        if max(h_best[1], v_best[1]) >= 5:
+            if h_best[1] >= v_best[1]:
+                start, length = h_best
+                return "horizontal_5", [divmod(start + k, n) for k in range(length)]
+            start, length = v_best
+            return "vertical_5", [divmod(start + k * n, n) for k in range(length)]
+
+        # 横竖三连相交：两条都在端点为L形，一条在端点为T形，都在中间为十字
+        best = None
+        for i in sorted(component):
+            h_start, h_length = h_run[i]
+            v_start, v_length = v_run[i]
+            if h_length < 3 or v_length < 3:
+                continue
+            ends = (i - h_start in (0, h_length - 1)) + ((i - v_start) // n in (0, v_length - 1))
+            rank = 2 - ends  # 十字2 > T形1 > L形0
+            if best is None or rank > best[0]:
+                best = (rank, i)
+        if best is not None:
+            rank, pivot = best
+            return ("l_shape", "t_shape", "cross")[rank], [divmod(pivot, n)]
+
+        # 四连
+        if h_best[1] >= 4 or v_best[1] >= 4:
+            if h_best[1] >= v_best[1]:
+                start, length = h_best
+                return "horizontal_4", [divmod(start + k, n) for k in range(length)]
+            start, length = v_best
+            return "vertical_4", [divmod(start + k * n, n) for k in range(length)]
+        return None
+
+    def generate_special_element(self, pattern, positions):
+        """根据消除模式生成特殊元素"""
+        if not positions:
+            return None
+
+        # 计算中心位置
+        center_row, center_col = positions[len(positions) // 2]
+
+        # 根据模式生成特殊元素
+        if pattern == "horizontal_4":  # 横向四连
+            return (center_row, center_col, ElementType.横向特效)
+        elif pattern == "vertical_4":  # 纵向四连
+            return (center_row, center_col, ElementType.纵向特效)
+        elif pattern == "horizontal_5" or pattern == "vertical_5":  # 五连
+            return (center_row, center_col, ElementType.魔力鸟)
+        elif pattern in ("l_shape", "t_shape", "cross"):  # L形、T形或十字
+            return (center_row, center_col, ElementType.爆炸特效)
+
+        return None
+
+    # ---------- 消除、下落与填充 ----------
+    def eliminate(self, removable, step):
+        """消除方块：计分、更新目标进度并清空格子"""
+        points = int(len(removable) * 10 * (1 + (self.combo_count // 3) * 0.2))  # 每3连击增加20%得分
+        self.score += points
+        self.combo_count += 1
+        step.points = points
+
+        n = self.grid_size
+        board = self.board
+        cells = board.cells
+        counts_before = list(board.counts)
+        for (row, col) in removable:
+            i = row * n + col
+            code = cells[i]
+            if code == EMPTY:
+                continue
+            step.cleared.append((row, col, CODE_TO_ELEMENT[code]))
+            board.set_index(i, EMPTY)
+
+        # 更新目标进度：每种颜色的消除数由棋盘计数的差值直接得到
+        for obj in self.objectives:
+            code = ELEMENT_TO_CODE[obj.target_type]
+            obj.add_progress(counts_before[code] - board.counts[code])
+
+    def collapse_and_refill(self, step=None):
+        """下落与填充合并的内核，返回是否有新元素
+
+        每列一次性压实（去掉空格后的字节串整体落到底部），所有空位所需的随机数
+        用一次getrandbits抽取，每个空位取32位映射到候选颜色上；候选颜色排除
+        会与左边两格或上边两格立即连成三连的颜色。只处理drop_columns给出的列
+        （升序，左边的列总是先填好），也只把值发生变化的格子写回棋盘。
+        """
+        n = self.grid_size
+        board = self.board
+        cells = board.cells
+        holes = board.count(EMPTY)
+        if not holes:
+            return False
+        draws = struct.unpack(f"<{holes}I", self.rng.getrandbits(32 * holes).to_bytes(4 * holes, "little"))
+        k = 0
+        for col in board.drop_columns():
+            column = cells[col::n]
+            kept = column.replace(b"\0", b"")
+            missing = n - len(kept)
+            if not missing:
+                continue
+
+            # 下落：非空元素保持顺序压到底部（自下而上记录移动）
+            if step is not None:
+                to_row = n - 1
+                for from_row in range(n - 1, -1, -1):
+                    if column[from_row] != EMPTY:
+                        if from_row != to_row:
+                            step.drops.append((col, from_row, to_row))
+                        to_row -= 1
+
+            # 填充：顶部空位自上而下取色
+            new = bytearray(missing) + kept
+            for row in range(missing):
+                left1 = cells[row * n + col - 1] if col > 0 else EMPTY
+                left2 = cells[row * n + col - 2] if col > 1 else EMPTY
+                up1 = new[row - 1] if row > 0 else EMPTY
+                up2 = new[row - 2] if row > 1 else EMPTY
+                candidates = refill_candidates(left1, left2, up1, up2)
+                code = candidates[draws[k] * len(candidates) >> 32]
+                k += 1
+                new[row] = code
+                if step is not None:
+                    step.refills.append((row, col, CODE_TO_ELEMENT[code]))
+
+            # 只写回变化的格子
+            for row in range(n):
+                if new[row] != column[row]:
+                    board.set_index(row * n + col, new[row])
+        return True
+
+    # ---------- 可行交换与提示 ----------
+    def _swap_gain(self, i, j):
+        """不做整盘扫描，只看交换后两个格子周围的局部形状，估算能消除的方块数（0为无效交换）"""
+        n = self.grid_size
+        cells = self.board.cells
+        a, b = cells[i], cells[j]
+        if a == EMPTY or b == EMPTY:
+            return 0
+
+        # 魔力鸟参与的交换总是有效
+        if a == BIRD_CODE or b == BIRD_CODE:
+            other = b if a == BIRD_CODE else a
+            if other == BIRD_CODE:
+                return n * n
+            if other <= NUM_COLORS:
+                return self.board.count(other) + 1
+            return n + 1
+        # 横向/纵向/爆炸特效与相邻方块交换即可触发
+        if a in TRIGGER_CODES or b in TRIGGER_CODES:
+            return n if HORIZONTAL_CODE in (a, b) or VERTICAL_CODE in (a, b) else 9
+        if a == b:
+            return 0
+
+        # 临时交换（直接改bytearray，不记入脏区域），检查两格是否连成三连
+        cells[i], cells[j] = b, a
+        gain = 0
+        for pos, code in ((i, b), (j, a)):
+            if code <= NUM_COLORS:
+                horizontal, vertical = line_counts(cells, n, pos, code)
+                if horizontal >= 3:
+                    gain += horizontal
+                if vertical >= 3:
+                    gain += vertical
+        cells[i], cells[j] = a, b
+        return gain
+
+    def _iter_legal_moves(self):
+        """逐个产出可行交换及其估算收益 (((r1, c1), (r2, c2)), gain)"""
+        n = self.grid_size
+        if self.backend == "bitboard":
+            # 位棋盘先求出全部可行交换，只对它们估算收益
+            right, down = self.board.legal_move_masks()
+            for i in iter_bits(right | down):
+                row, col = divmod(i, n)
+                if right >> i & 1:
+                    yield ((row, col), (row, col + 1)), self._swap_gain(i, i + 1)
+                if down >> i & 1:
+                    yield ((row, col), (row + 1, col)), self._swap_gain(i, i + n)
+            return
+        for i in range(n * n):
+            row, col = divmod(i, n)
+            if col < n - 1:
+                gain = self._swap_gain(i, i + 1)
+                if gain:
+                    yield ((row, col), (row, col + 1)), gain
+            if row < n - 1:
+                gain = self._swap_gain(i, i + n)
+                if gain:
+                    yield ((row, col), (row + 1, col)), gain
+
+    def list_legal_moves(self):
+        """枚举所有能产生消除的相邻交换"""
+        if self.backend == "bitboard":
+            n = self.grid_size
+            right, down = self.board.legal_move_masks()
+            moves = []
+            for i in iter_bits(right | down):
+                row, col = divmod(i, n)
+                if right >> i & 1:
+                    moves.append(((row, col), (row, col + 1)))
+                if down >> i & 1:
+                    moves.append(((row, col), (row + 1, col)))
+            return moves
+        return [move for move, _ in self._iter_legal_moves()]
+
+    def has_legal_move(self):
+        """是否存在可行交换（找到一个即返回）"""
+        if self.backend == "bitboard":
+            return any(self.board.legal_move_masks())
+        return next(self._iter_legal_moves(), None) is not None
+
+    def rank_legal_moves(self, limit=None):
+        """按估算收益从高到低排列的可行交换（最多limit个）"""
+        ranked = sorted(self._iter_legal_moves(), key=lambda item: item[1], reverse=True)
+        return [move for move, _ in ranked[:limit]]
+
+    def find_hint(self):
+        """返回估算收益最大的可行交换，没有时返回None"""
+        best = max(self._iter_legal_moves(), key=lambda item: item[1], default=None)
+        return best[0] if best else None
+
+    def shuffle_board(self, max_attempts=20):
+        """无可行交换时重新洗牌：优先打乱现有方块，多次失败则重新生成网格
+
+        重新生成时按棋盘能容纳的3x3模板数保证至少1个、至多MIN_INITIAL_MOVES个可行交换；
+        边长不足3的棋盘放不下任何模板，直接报错而不是留下一个死局。
+        """
+        n = self.grid_size
+        codes = list(self.board.cells)
+        for _ in range(max_attempts):
+            self.rng.shuffle(codes)
+            self.board.load(bytes(codes))
+            if not self._find_removable_indices() and self.has_legal_move():
+                return
+        tiles = (n // 3) ** 2
+        if not tiles:
+            raise ValueError(f"{n}x{n}的网格放不下可行交换，无法洗牌")
+        self.generate_valid_grid(min_moves=min(MIN_INITIAL_MOVES, tiles))
+
+    # ---------- 交换结算 ----------
+    def is_adjacent(self, r1, c1, r2, c2):
+        """判断两个方块是否相邻"""
+        return abs(r1 - r2) + abs(c1 - c2) == 1
+
+    def apply_move(self, r1, c1, r2, c2):
+        """执行一次交换并同步结算整次连锁，返回MoveResult"""
+        result = MoveResult(r1, c1, r2, c2)
+        in_range = all(0 <= v < self.grid_size for v in (r1, c1, r2, c2))
+        if self.status is not None or not in_range or not self.is_adjacent(r1, c1, r2, c2):
+            return result
+
+        # 特殊元素交换直接得到消除范围
+        removable, result.swapped = self._special_swap_removable(r1, c1, r2, c2)
+        detect_pattern = False
+        if removable is None:
+            # 普通交换
+            self.board.swap(r1, c1, r2, c2)
+            removable = self.find_removable_blocks()
+            if not removable:
+                # 没有可消除的方块，恢复原状（不消耗步数）
+                self.board.swap(r1, c1, r2, c2)
+                return result
+            result.swapped = True
+            detect_pattern = True
+
+        # 有效交换：消耗1步
+        result.valid = True
+        self.move_log.append((r1, c1, r2, c2))
+        self.remaining_steps -= 1
+        score_before = self.score
+        self._resolve_cascade(removable, detect_pattern, result)
+        result.score_gained = self.score - score_before
+
+        if self.status is None and self.remaining_steps <= 0:
+            self.status = "lose"
+        result.status = self.status
+
+        # 连锁结束后已无可行交换：自动洗牌
+        if self.status is None and not self.has_legal_move():
+            self.shuffle_board()
+            result.shuffled = True
+        return result
+
+    def _resolve_cascade(self, removable, detect_pattern, result):
+        """循环结算：消除 → 生成特效 → 下落 → 填充 → 检查连锁"""
+        chain_depth = 0
+        while removable:
+            step = CascadeStep()
+            specials = []
+            if detect_pattern:
+                # 每个连通块按各自的形状生成特殊元素
+                for pattern, positions in self.detect_elimination_patterns(removable):
+                    special_element = self.generate_special_element(pattern, positions)
+                    if special_element:
+                        specials.append(special_element)
+
+            removable = self.resolve_blasts(removable)
+            self.eliminate(removable, step)
+            for r, c, elem_type in specials:
+                self.board.set_element(r, c, elem_type)
+            step.spawned = specials
+
+            step.score = self.score
+            step.combo_count = self.combo_count
+            step.objective_counts = [obj.current_count for obj in self.objectives]
+            result.steps.append(step)
+
+            # 关卡完成：立即结束
+            if self.objectives and self.is_level_completed():
+                self.status = "win"
+                return
+
+            self.collapse_and_refill(step)
+
+            chain_depth += 1
+            if chain_depth >= MAX_CHAIN_DEPTH:
+                return
+            removable = self.find_removable_blocks()
+            detect_pattern = True
+
+# -------------------------- 向量化检测（需要numpy） --------------------------
+def _require_numpy():
+    """确认numpy可用"""
+    if np is None:
+        raise ImportError("向量化检测需要安装numpy：pip install numpy")
+
+def boards_to_array(boards):
+    """把若干Board打包成形状为(B, N, N)的uint8数组"""
+    _require_numpy()
+    return np.stack([np.frombuffer(bytes(board.cells), dtype=np.uint8).reshape(board.size, board.size)
+                     for board in boards])
+
+def find_runs_mask(cells):
+    """用错位相等掩码一次找出所有横向/纵向≥3的普通元素游程，支持(N, N)或(B, N, N)"""
+    _require_numpy()
+    a = np.asarray(cells)
+    regular = (a > EMPTY) & (a <= NUM_COLORS)
+    mask = np.zeros(a.shape, dtype=bool)
+
+    # 横向：a[c] == a[c+1] == a[c+2]
+    h = regular[..., :, :-2] & (a[..., :, :-2] == a[..., :, 1:-1]) & (a[..., :, 1:-1] == a[..., :, 2:])
+    mask[..., :, :-2] |= h
+    mask[..., :, 1:-1] |= h
+    mask[..., :, 2:] |= h
+
+    # 纵向：a[r] == a[r+1] == a[r+2]
+    v = regular[..., :-2, :] & (a[..., :-2, :] == a[..., 1:-1, :]) & (a[..., 1:-1, :] == a[..., 2:, :])
+    mask[..., :-2, :] |= v
+    mask[..., 1:-1, :] |= v
+    mask[..., 2:, :] |= v
+    return mask
+
+def find_removable_mask(cells):
+    """在游程掩码基础上反复膨胀到同色连通块，结果与BoardEngine.find_removable_blocks一致"""
+    _require_numpy()
+    a = np.asarray(cells)
+    mask = find_runs_mask(a)
+    same_right = a[..., :, :-1] == a[..., :, 1:]
+    same_down = a[..., :-1, :] == a[..., 1:, :]
+    while True:
+        grown = mask.copy()
+        grown[..., :, 1:] |= mask[..., :, :-1] & same_right
+        grown[..., :, :-1] |= mask[..., :, 1:] & same_right
+        grown[..., 1:, :] |= mask[..., :-1, :] & same_down
+        grown[..., :-1, :] |= mask[..., 1:, :] & same_down
+        if np.array_equal(grown, mask):
+            return mask
+        mask = grown
+
+def has_matches(cells):
+    """每块棋盘是否存在可消除组合，(B, N, N)输入返回长度为B的布尔数组"""
+    return find_runs_mask(cells).any(axis=(-2, -1))
+
+# -------------------------- 关卡难度估计 --------------------------
+def play_level(cells, grid_size, objectives, seed, policy="random", step_limit=PLAYOUT_STEP_LIMIT,
+               backend="bytes"):
+    """模拟一局：返回完成全部目标用掉的步数，步数上限内未完成返回None
+
+    objectives为[(目标编码, 需要数量)]，policy为"random"（随机可行交换）、"greedy"（每步取提示），
+    或任何带choose_move(engine)方法的对象（例如消消乐智能体中的Agent）；对象若有reset(seed)方法，
+    开局前用seed重置它，使结果只取决于seed而与它之前下过哪些局无关。
+    backend选择棋盘后端，两种后端的模拟结果相同。
+    """
+    rng = random.Random(seed)
+    engine = BoardEngine(grid_size, rng, backend=backend)
+    engine.board.load(cells)
+    engine.objectives = [LevelObjective(CODE_TO_ELEMENT[code], required) for code, required in objectives]
+    engine.remaining_steps = step_limit
+    if hasattr(policy, "reset"):
+        policy.reset(seed)
+    while engine.status is None:
+        if hasattr(policy, "choose_move"):
+            move = policy.choose_move(engine)
+        elif policy == "greedy":
+            move = engine.find_hint()
+        else:
+            moves = engine.list_legal_moves()
+            move = rng.choice(moves) if moves else None
+        if move is None:
+            return None
+        (r1, c1), (r2, c2) = move
+        engine.apply_move(r1, c1, r2, c2)
+    return step_limit - engine.remaining_steps if engine.status == "win" else None
+
+def _play_level_batch(args):
+    """进程池任务：按给定种子依次模拟多局"""
+    cells, grid_size, objectives, seeds, policy, step_limit, backend = args
+    return [play_level(cells, grid_size, objectives, seed, policy, step_limit, backend) for seed in seeds]
+
+class DifficultyEstimate:
+    """模拟结果：每局通关所需步数（未通关为None）"""
+    def __init__(self, steps_needed, step_limit):
+        self.steps_needed = steps_needed
+        self.step_limit = step_limit
+
+    def win_rate(self, budget):
+        """给定步数预算下的通关率"""
+        if not self.steps_needed:
+            return 0.0
+        wins = sum(1 for steps in self.steps_needed if steps is not None and steps <= budget)
+        return wins / len(self.steps_needed)
+
+    def win_rate_curve(self):
+        """通关率随步数预算变化的曲线 [(步数, 通关率)]"""
+        return [(budget, self.win_rate(budget)) for budget in range(1, self.step_limit + 1)]
+
+    def steps_for_win_rate(self, target_win_rate):
+        """达到目标通关率所需的最少步数，上限内达不到时返回步数上限"""
+        for budget, rate in self.win_rate_curve():
+            if rate >= target_win_rate:
+                return budget
+        return self.step_limit
+
+def _difficulty_chunks(engine, playouts, policy, seed, workers, step_limit, backend):
+    """把模拟试玩按种子交错分给workers个进程任务（第k个任务负责种子seed+k, seed+k+workers, ...）"""
+    objectives = [(ELEMENT_TO_CODE[obj.target_type], obj.required_count) for obj in engine.objectives]
+    cells = bytes(engine.board.cells)
+    seeds = [seed + k for k in range(playouts)]
+    workers = min(workers or os.cpu_count() or 1, playouts) or 1
+    return [(cells, engine.grid_size, objectives, seeds[k::workers], policy, step_limit, backend)
+            for k in range(workers)]
+
+def _merge_difficulty(results, step_limit):
+    """按种子顺序还原各任务的结果"""
+    workers = len(results)
+    steps_needed = [None] * sum(len(batch) for batch in results)
+    for k, batch in enumerate(results):
+        for m, steps in enumerate(batch):
+            steps_needed[k + m * workers] = steps
+    return DifficultyEstimate(steps_needed, step_limit)
+
+def estimate_difficulty(engine, playouts=DEFAULT_PLAYOUTS, policy="random", seed=0,
+                        workers=None, step_limit=PLAYOUT_STEP_LIMIT, backend="bytes"):
+    """在进程池中并行模拟当前关卡，返回DifficultyEstimate
+
+    每局使用固定种子seed+k，结果与进程数无关；workers=1时在当前进程中执行。
+    """
+    chunks = _difficulty_chunks(engine, playouts, policy, seed, workers, step_limit, backend)
+    if len(chunks) == 1:
+        results = [_play_level_batch(chunks[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            results = list(pool.map(_play_level_batch, chunks))
+    return _merge_difficulty(results, step_limit)
+
+def submit_difficulty(pool, engine, playouts=DEFAULT_PLAYOUTS, policy="random", seed=0,
+                      workers=None, step_limit=PLAYOUT_STEP_LIMIT, backend="bytes"):
+    """把模拟试玩提交到调用方持有的进程池，立即返回futures（不阻塞）
+
+    全部完成后用collect_difficulty汇总，结果与estimate_difficulty相同。
+    """
+    chunks = _difficulty_chunks(engine, playouts, policy, seed, workers, step_limit, backend)
+    return [pool.submit(_play_level_batch, chunk) for chunk in chunks]
+
+def collect_difficulty(futures, step_limit=PLAYOUT_STEP_LIMIT):
+    """汇总submit_difficulty的futures，返回DifficultyEstimate（进程池出错时抛出相应异常）"""
+    return _merge_difficulty([future.result() for future in futures], step_limit)
+
+# -------------------------- 关卡包 --------------------------
+def generate_level(seed, grid_size=BASE_GRID_SIZE, playouts=DEFAULT_PLAYOUTS, policy="random",
+                   step_limit=PLAYOUT_STEP_LIMIT, target_win_rate=TARGET_WIN_RATE):
+    """按种子生成一关（目标、棋盘）并模拟试玩定出步数
+
+    与游戏相同的顺序使用随机数：先目标后网格。返回(种子, 最大步数, 通关率, 目标列表, 棋盘编码)，
+    在步数上限内达不到目标通关率时返回None。可直接用作进程池任务。
+    """
+    engine = BoardEngine(grid_size, seed=seed)
+    engine.init_level_objectives()
+    engine.generate_valid_grid()
+    estimate = estimate_difficulty(engine, playouts, policy, seed=seed, workers=1, step_limit=step_limit)
+    steps = estimate.steps_for_win_rate(target_win_rate)
+    win_rate = estimate.win_rate(steps)
+    if win_rate < target_win_rate:
+        return None
+    objectives = [(ELEMENT_TO_CODE[obj.target_type], obj.required_count) for obj in engine.objectives]
+    return seed, steps, win_rate, objectives, bytes(engine.board.cells)
+
+def write_level_pack(path, grid_size, levels):
+    """把generate_level的结果写成关卡包文件（所有关卡的网格边长和目标数必须相同）"""
+    num_objectives = len(levels[0][3]) if levels else 0
+    with open(path, "wb") as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, grid_size, num_objectives, len(levels)))
+        for seed, steps, win_rate, objectives, cells in levels:
+            if len(objectives) != num_objectives or len(cells) != grid_size * grid_size:
+                raise ValueError("关卡包中的关卡规格不一致")
+            f.write(PACK_LEVEL.pack(seed, steps, int(win_rate * 1000)))
+            for code, required in objectives:
+                f.write(REPLAY_OBJECTIVE.pack(code, required))
+            f.write(cells)
+
+class LevelPack:
+    """只读关卡包：打开时只读文件头，按关卡序号直接定位到定长记录，启动开销与关卡数无关"""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        header = self.file.read(PACK_HEADER.size)
+        if len(header) < PACK_HEADER.size:
+            self.file.close()
+            raise ValueError("不是有效的消消乐关卡包")
+        magic, version, self.grid_size, self.num_objectives, self.count = PACK_HEADER.unpack(header)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self.file.close()
+            raise ValueError("不是有效的消消乐关卡包")
+        self.record_size = (PACK_LEVEL.size + self.num_objectives * REPLAY_OBJECTIVE.size
+                            + self.grid_size * self.grid_size)
+        # 定长记录：文件长度必须与文件头声明的关卡数一致，截断或多出数据都视为损坏
+        if os.fstat(self.file.fileno()).st_size != PACK_HEADER.size + self.count * self.record_size:
+            self.file.close()
+            raise ValueError("关卡包长度与文件头不符，文件可能已损坏")
+
+    def __len__(self):
+        return self.count
+
+    def read(self, index):
+        """读取第index关，返回(种子, 最大步数, 通关率, 目标列表, 棋盘编码)"""
+        if not 0 <= index < self.count:
+            raise IndexError(f"关卡序号{index}超出范围（共{self.count}关）")
+        self.file.seek(PACK_HEADER.size + index * self.record_size)
+        data = self.file.read(self.record_size)
+        seed, steps, win_rate = PACK_LEVEL.unpack_from(data, 0)
+        offset = PACK_LEVEL.size
+        objectives = []
+        for _ in range(self.num_objectives):
+            objectives.append(REPLAY_OBJECTIVE.unpack_from(data, offset))
+            offset += REPLAY_OBJECTIVE.size
+        return seed, steps, win_rate / 1000, objectives, data[offset:]
+
+    def make_engine(self, index, backend="bytes"):
+        """载入第index关，返回可以直接开始对局的BoardEngine"""
+        seed, steps, _, objectives, cells = self.read(index)
+        engine = BoardEngine(self.grid_size, seed=seed, backend=backend)
+        engine.objectives = [LevelObjective(CODE_TO_ELEMENT[code], required) for code, required in objectives]
+        engine.board.load(cells)
+        engine.max_steps = engine.remaining_steps = steps
+        engine.begin_play()
+        return engine
+
+    def close(self):
+        self.file.close()
+
+# -------------------------- 录像与回放 --------------------------
+def encode_session(engine):
+    """把一局游戏编码为紧凑的二进制录像：种子、目标、逐步交换"""
+    if engine.seed is None:
+        raise ValueError("引擎没有种子，无法录像")
+    n = engine.grid_size
+    data = bytearray(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, n, engine.seed,
+                                        engine.max_steps, len(engine.objectives)))
+    for obj in engine.objectives:
+        data += REPLAY_OBJECTIVE.pack(ELEMENT_TO_CODE[obj.target_type], obj.required_count)
+    for r1, c1, r2, c2 in engine.move_log:
+        data += REPLAY_MOVE.pack(r1 * n + c1, REPLAY_DIRECTIONS.index((r2 - r1, c2 - c1)))
+    return bytes(data)
+
+def decode_session(data):
+    """解析二进制录像，返回(网格边长, 种子, 最大步数, [(目标编码, 需要数量)], [(r1, c1, r2, c2)])"""
+    magic, version, n, seed, max_steps, num_objectives = REPLAY_HEADER.unpack_from(data, 0)
+    if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+        raise ValueError("不是有效的消消乐录像")
+    offset = REPLAY_HEADER.size
+    objectives = []
+    for _ in range(num_objectives):
+        objectives.append(REPLAY_OBJECTIVE.unpack_from(data, offset))
+        offset += REPLAY_OBJECTIVE.size
+    moves = []
+    for index, direction in REPLAY_MOVE.iter_unpack(data[offset:]):
+        r1, c1 = divmod(index, n)
+        dr, dc = REPLAY_DIRECTIONS[direction]
+        moves.append((r1, c1, r1 + dr, c1 + dc))
+    return n, seed, max_steps, objectives, moves
+
+def save_session(engine, path):
+    """保存录像文件"""
+    with open(path, "wb") as f:
+        f.write(encode_session(engine))
+
+def replay_session(data):
+    """无界面全速重演一局录像，返回结束时的BoardEngine
+
+    与游戏相同的顺序消耗随机数：先生成目标，再生成网格，之后逐步交换。
+    """
+    n, seed, max_steps, objectives, moves = decode_session(data)
+    engine = BoardEngine(n, seed=seed)
+    engine.init_level_objectives()
+    recorded = [(ELEMENT_TO_CODE[obj.target_type], obj.required_count) for obj in engine.objectives]
+    if recorded != objectives:
+        raise ValueError("录像中的目标与种子不一致")
+    engine.generate_valid_grid()
+    engine.begin_play()
+    engine.max_steps = engine.remaining_steps = max_steps
+    for r1, c1, r2, c2 in moves:
+        if not engine.apply_move(r1, c1, r2, c2).valid:
+            raise ValueError(f"录像中的交换({r1},{c1})-({r2},{c2})无效，规则或随机数流已改变")
+    return engine
+
+# -------------------------- 程序入口 --------------------------
+if __name__ == "__main__":
+    # 用法：python 消消乐引擎.py 录像文件...
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            engine = replay_session(f.read())
+        print(f"{path}: 步数 {len(engine.move_log)}/{engine.max_steps} | 分数 {engine.score} | 结果 {engine.status}")
@@ -0,0 +1,149 @@
+import random
+
+from 消消乐引擎 import TranspositionCache
+
+# -------------------------- 搜索配置 --------------------------
+WIN_VALUE = 10000         # 通关局面的估值
+MAX_BRANCH = 8            # 每个局面最多展开的交换数（按提示收益排序）
+TABLE_LIMIT = 200000      # 期望极大搜索的置换表最多保存的局面数（按最近使用淘汰）
+
+# -------------------------- 智能体 --------------------------
+class Agent:
+    """三消自动玩家基类：choose_move(state)对BoardEngine局面返回((r1, c1), (r2, c2))
+
+    子类只需实现search(state, moves)；展开和估值由基类提供。
+    """
+    def __init__(self, seed=0, max_branch=MAX_BRANCH):
+        self.rng = random.Random(seed)
+        self.max_branch = max_branch
+        self.nodes = 0  # 已展开的节点数
+
+    def reset(self, seed):
+        """重新播种并清空搜索状态，使同一seed的对局结果与之前下过的局无关"""
+        self.rng.seed(seed)
+        self.nodes = 0
+
+    def choose_move(self, state):
+        """选择一个交换；没有可行交换时返回None"""
+        moves = self.candidate_moves(state)
+        if not moves:
+            return None
+        if len(moves) == 1:
+            return moves[0]
+        return self.search(state, moves)
+
+    def search(self, state, moves):
+        """在候选交换中选出最佳的一个（由子类实现）"""
+        raise NotImplementedError
+
+    def candidate_moves(self, state):
+        """按提示收益排序的候选交换（最多max_branch个）"""
+        return state.rank_legal_moves(self.max_branch)
+
+    def expand(self, state, move, seed=None):
+        """在局面副本上执行交换，seed决定补充新方块的随机结果"""
+        self.nodes += 1
+        child = state.clone(random.Random(seed if seed is not None else self.rng.getrandbits(32)))
+        (r1, c1), (r2, c2) = move
+        child.apply_move(r1, c1, r2, c2)
+        return child
+
+    def state_key(self, state):
+        """局面键：棋盘增量维护的Zobrist哈希 + 目标进度"""
+        return state.board.hash, tuple(obj.current_count for obj in state.objectives)
+
+    def evaluate(self, state):
+        """局面估值：通关最优，其次是目标完成比例，分数只作为微小的平局裁决"""
+        if state.status == "win":
+            return WIN_VALUE + state.remaining_steps
+        progress = sum(obj.current_count / obj.required_count for obj in state.objectives)
+        return progress * 100 + state.score * 0.001
+
+class GreedyAgent(Agent):
+    """贪心：只看一步，选估值最高的交换"""
+    def search(self, state, moves):
+        return max(moves, key=lambda move: self.evaluate(self.expand(state, move)))
+
+class BeamSearchAgent(Agent):
+    """束搜索：每层只保留估值最高的beam_width个局面，向前看depth步"""
+    def __init__(self, depth=3, beam_width=4, **kwargs):
+        super().__init__(**kwargs)
+        self.depth = depth
+        self.beam_width = beam_width
+
+    def search(self, state, moves):
+        frontier = [(state, None)]  # (局面, 第一步交换)
+        best_value, best_move = float("-inf"), moves[0]
+        for level in range(self.depth):
+            candidates = []
+            seen = set()
+            for node, first_move in frontier:
+                node_moves = moves if first_move is None else self.candidate_moves(node)
+                for move in node_moves:
+                    child = self.expand(node, move)
+                    key = self.state_key(child)
+                    if key in seen:
+                        continue  # 不同交换顺序走到了同一局面
+                    seen.add(key)
+                    value = self.evaluate(child)
+                    candidates.append((value, child, first_move or move))
+            if not candidates:
+                break
+            candidates.sort(key=lambda item: item[0], reverse=True)
+            if candidates[0][0] > best_value:
+                best_value, best_move = candidates[0][0], candidates[0][2]
+            frontier = [(child, first_move) for _, child, first_move in candidates[:self.beam_width]
+                        if child.status is None]
+            if not frontier:
+                break
+        return best_move
+
+class ExpectimaxAgent(Agent):
+    """期望极大搜索：交换后补充的新方块视为随机节点，取samples次采样的平均值"""
+    def __init__(self, depth=2, samples=3, **kwargs):
+        super().__init__(**kwargs)
+        self.depth = depth
+        self.samples = samples
+        self.value_table = TranspositionCache(TABLE_LIMIT)  # (局面键, 剩余步数, 剩余深度) → 期望值
+
+    def reset(self, seed):
+        super().reset(seed)
+        self.value_table = TranspositionCache(TABLE_LIMIT)
+
+    def search(self, state, moves):
+        return max(moves, key=lambda move: self._chance_value(state, move, self.depth))
+
+    def _chance_value(self, state, move, depth):
+        """随机节点：对补充结果采样求平均"""
+        total = 0.0
+        for _ in range(self.samples):
+            total += self._max_value(self.expand(state, move), depth - 1)
+        return total / self.samples
+
+    def _max_value(self, state, depth):
+        """极大节点：选期望值最高的交换"""
+        if depth <= 0 or state.status is not None:
+            return self.evaluate(state)
+        key = (self.state_key(state), state.remaining_steps, depth)  # 通关估值与剩余步数有关
+        value = self.value_table.get(key)
+        if value is not None:
+            return value
+        moves = self.candidate_moves(state)
+        if moves:
+            value = max(self._chance_value(state, move, depth) for move in moves)
+        else:
+            value = self.evaluate(state)
+        self.value_table.put(key, value)
+        return value
+
+AGENTS = {
+    "greedy": GreedyAgent,
+    "beam": BeamSearchAgent,
+    "expectimax": ExpectimaxAgent,
+}
+
+def make_agent(strategy="greedy", **kwargs):
+    """按名称创建智能体：greedy / beam / expectimax"""
+    if strategy not in AGENTS:
+        raise ValueError(f"未知的搜索策略: {strategy}，可选: {', '.join(AGENTS)}")
+    return AGENTS[strategy](**kwargs)